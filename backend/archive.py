@@ -0,0 +1,123 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from ids import new_id
+from logger import get_logger
+
+logger = get_logger("Archive")
+
+def _safe_id(session_id: str) -> str:
+    # Session ids come from clients; keep them from escaping the archive directory
+    return "".join(ch for ch in session_id if ch.isalnum() or ch in "-_")
+
+class SessionArchive:
+    """
+    Cold storage for archived sessions: gzip-compressed JSON blobs addressed by
+    key. Every write creates a blob under a new key, which the sessions row then
+    records in archive_key, so a blob a row points to is never overwritten.
+    For multi-node deployments the directory must be on shared storage.
+    """
+    def __init__(self, archive_dir: str):
+        self.archive_dir = archive_dir
+        os.makedirs(archive_dir, exist_ok=True)
+
+    @staticmethod
+    def blob_key(session_id: str, archive_key: str = None) -> str:
+        """The key of a session's blob; sessions archived before keys were recorded use their id."""
+        return archive_key or _safe_id(session_id)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.archive_dir, f"{key}.json.gz")
+
+    def write(self, session_id: str, rows: list) -> str:
+        """Store rows in a new blob and return its key."""
+        key = f"{_safe_id(session_id)}.{new_id()}"
+        path = self.path_for(key)
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, default=_encode_datetime)
+        os.replace(tmp_path, path)
+        return key
+
+    def read(self, key: str) -> list:
+        with gzip.open(self.path_for(key), "rt", encoding="utf-8") as f:
+            rows = json.load(f)
+        for row in rows:
+            if row.get("created_at"):
+                row["created_at"] = datetime.fromisoformat(row["created_at"])
+        return rows
+
+    def delete(self, key: str):
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+def _encode_datetime(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+class ArchiveService:
+    """
+    Background job that moves sessions idle longer than idle_days out of
+    conversation_history into the SessionArchive, then reclaims the freed pages.
+    DBService rehydrates an archived session transparently on next access.
+    Every worker starts one, but only the holder of the "archive" lease runs it.
+    """
+    LEASE = "archive"
+
+    def __init__(self, db_service, idle_days: float = 30, interval: float = 3600, batch_size: int = 50):
+        self.db_service = db_service
+        self.idle_days = idle_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.holder = new_id()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            try:
+                # Let another worker take over without waiting for the lease to expire
+                await self.db_service.release_lease(self.LEASE, self.holder)
+            except Exception as e:
+                logger.warning("Failed to release archive lease: %s", e)
+
+    async def _run(self):
+        while True:
+            try:
+                # Renewed every run; outlives one missed run so the job does not hop between workers
+                if await self.db_service.acquire_lease(self.LEASE, self.holder, self.interval * 2):
+                    await self.archive_cold_sessions()
+            except Exception as e:
+                logger.error("Archival run failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def archive_cold_sessions(self) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=self.idle_days)
+        archived = 0
+        while True:
+            session_ids = await self.db_service.get_cold_sessions(cutoff, self.batch_size)
+            if not session_ids:
+                break
+            for session_id in session_ids:
+                if await self.db_service.archive_session(session_id, cutoff):
+                    archived += 1
+            if len(session_ids) < self.batch_size:
+                break
+        if archived:
+            await self.db_service.incremental_vacuum()
+            logger.info("Archived %d sessions idle since %s", archived, f"{cutoff:%Y-%m-%d}")
+        return archived
@@ -0,0 +1,93 @@
+"""
+Startup benchmark for the backend.
+
+Measures, each averaged over several runs:
+  - cold import of main.py in a fresh interpreter (what a crash restart pays)
+  - DBService init against a fresh database (full migration) and a current one
+  - lifespan startup/shutdown of the FastAPI app
+
+Usage: python benchmarks/bench_startup.py [--runs N]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def bench_cold_import(runs: int):
+    samples = []
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    heavy = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print(','.join(m for m in ('mem0', 'openai', 'httpx', 'qdrant_client', 'grpc') if m in sys.modules) or 'none')"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return samples, heavy
+
+
+def bench_db_init(runs: int):
+    from db import DBService, sqlite_url
+
+    async def init_once(path: str):
+        db = DBService(sqlite_url(path))
+        t = time.perf_counter()
+        await db.init()
+        elapsed = time.perf_counter() - t
+        await db.close()
+        return elapsed
+
+    fresh, current = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            fresh.append(asyncio.run(init_once(path)))
+            current.append(asyncio.run(init_once(path)))
+    return fresh, current
+
+
+def bench_lifespan(runs: int):
+    import main
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            main.storage_config["sqlite_path"] = os.path.join(tmp, "bench.db")
+
+            async def cycle():
+                t = time.perf_counter()
+                async with main.lifespan(main.app):
+                    elapsed = time.perf_counter() - t
+                return elapsed
+
+            samples.append(asyncio.run(cycle()))
+    return samples
+
+
+def report(name: str, samples: list):
+    ms = [s * 1000 for s in samples]
+    print(f"{name:<32} mean {statistics.mean(ms):8.2f} ms   min {min(ms):8.2f} ms   max {max(ms):8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples, heavy = bench_cold_import(args.runs)
+    report("cold import main", samples)
+    print(f"{'heavy modules after import':<32} {heavy}")
+    fresh, current = bench_db_init(args.runs)
+    report("db init (fresh schema)", fresh)
+    report("db init (schema current)", current)
+    report("lifespan startup", bench_lifespan(args.runs))
@@ -0,0 +1,122 @@
+"""
+Throughput benchmark for multi-worker mode.
+
+Seeds a temporary SQLite database, starts uvicorn with 1..N workers against it
+and drives the read endpoints (/sessions, /history, /rules) with concurrent
+clients. Requests per second should grow with the worker count up to the
+number of cores.
+
+Usage: python benchmarks/bench_workers.py [--workers 1,2,4] [--duration 10] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+
+async def seed(db_path: str, users: int = 20, sessions_per_user: int = 5, turns: int = 40):
+    from db import DBService, sqlite_url
+    db = DBService(sqlite_url(db_path))
+    await db.init()
+    targets = []
+    for u in range(users):
+        user_id = await db.get_or_create_user(f"bench-user-{u}")
+        for s in range(sessions_per_user):
+            session_id = f"bench-{u}-{s}"
+            await db.create_session(user_id, session_id, f"会话 {s}")
+            await db.save_hard_rule(user_id, session_id, "回答要简洁")
+            for t in range(turns):
+                await db.save_message(user_id, session_id, "user", f"问题 {t}：" + "请解释一下" * 20)
+                await db.save_message(user_id, session_id, "assistant", "回答内容" * 200, "思考过程" * 100)
+            targets.append((user_id, session_id))
+    await db.close()
+    return targets
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_ready(client, base_url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/readyz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+async def drive(base_url: str, targets: list, duration: float, concurrency: int):
+    import httpx
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await wait_ready(client, base_url)
+        done = 0
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        async def worker():
+            nonlocal done, errors
+            while time.monotonic() < deadline:
+                user_id, session_id = random.choice(targets)
+                path = random.choice([
+                    f"/sessions/{user_id}",
+                    f"/history/{session_id}",
+                    f"/rules?userId={user_id}&sessionId={session_id}",
+                ])
+                try:
+                    response = await client.get(base_url + path)
+                    if response.status_code >= 400:
+                        errors += 1
+                    done += 1
+                except Exception:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return done / duration, errors
+
+
+def run(workers: int, db_path: str, targets: list, duration: float, concurrency: int):
+    port = free_port()
+    env = dict(os.environ, AIMIN_DB_PATH=db_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        return asyncio.run(drive(f"http://127.0.0.1:{port}", targets, duration, concurrency))
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        targets = asyncio.run(seed(db_path))
+        print(f"cores: {os.cpu_count()}")
+        baseline = None
+        for n in [int(w) for w in args.workers.split(",")]:
+            rps, errors = run(n, db_path, targets, args.duration, args.concurrency)
+            baseline = baseline or rps
+            print(f"workers {n:>2}: {rps:10.1f} req/s   x{rps / baseline:4.2f}   errors {errors}")
@@ -0,0 +1,324 @@
+"""
+Offline replay of recorded sessions through the /chat pipeline.
+
+Copies an omnimind.db snapshot to a temporary directory, picks sessions from it
+and replays each user turn through main.chat() into a fresh session, so history,
+rules and summaries grow the way they did in production. Upstreams are replaced:
+the model replays the recorded assistant messages (tool calls included), tools
+return the recorded outputs, Mem0 returns nothing and titles are not generated.
+store_hard_rule still runs for real so rule growth is reproduced.
+
+Per turn it reports the estimated prompt tokens, context-assembly time (request
+start to the first model call), time spent in SQL, and the history rows loaded.
+
+Usage: python benchmarks/replay.py omnimind.db [--sessions 10] [--session-id ID ...]
+                                             [--max-turns N] [--archive-dir DIR] [--json out.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import deque
+from types import SimpleNamespace
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+# A 1x1 PNG stands in for recorded image turns; the original image is not stored
+PLACEHOLDER_IMAGE = (
+    "data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR4nGNgYGD4DwABBAEAwS2OUAAAAABJRU5ErkJggg=="
+)
+FALLBACK_ANSWER = "（回放：录制中没有对应的回复）"
+
+
+class TurnStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.first_model_call = None
+        self.model_calls = 0
+        self.prompt_tokens = 0
+        self.first_prompt_tokens = 0
+        self.prompt_messages = 0
+        self.history_rows = 0
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.summarized = False
+
+    def as_dict(self, total: float) -> dict:
+        context = (self.first_model_call or self.started) - self.started
+        return {
+            "prompt_tokens": self.first_prompt_tokens,
+            "prompt_tokens_all_calls": self.prompt_tokens,
+            "prompt_messages": self.prompt_messages,
+            "model_calls": self.model_calls,
+            "history_rows": self.history_rows,
+            "context_ms": round(context * 1000, 2),
+            "db_ms": round(self.db_time * 1000, 2),
+            "db_queries": self.db_queries,
+            "total_ms": round(total * 1000, 2),
+            "summarized": self.summarized,
+        }
+
+
+class Replay:
+    """The recorded responses of the turn being replayed, plus its stats."""
+    def __init__(self):
+        self.stats = None
+        self.script = deque()
+        self.tool_outputs = deque()
+
+    def begin(self, turn: dict):
+        self.stats = TurnStats()
+        self.script = deque(turn["assistant"])
+        self.tool_outputs = deque(turn["tool_outputs"])
+
+
+def _chunk(**delta):
+    delta.setdefault("content", None)
+    delta.setdefault("reasoning_content", None)
+    delta.setdefault("tool_calls", None)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(**delta))])
+
+
+class FakeStream:
+    def __init__(self, chunks: list):
+        self._chunks = iter(chunks)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+class FakeModelClient:
+    """Deterministic stand-in for AsyncOpenAI that answers from the recorded turn."""
+    def __init__(self, replay: Replay):
+        self.replay = replay
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        import main
+        messages = kwargs["messages"]
+        if not kwargs.get("stream"):
+            # History summarization: a deterministic summary of realistic size
+            text = messages[-1]["content"]
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text[-1000:]))])
+
+        stats = self.replay.stats
+        if stats.first_model_call is None:
+            stats.first_model_call = time.perf_counter()
+            stats.first_prompt_tokens = main.estimate_tokens(messages)
+            stats.prompt_messages = len(messages)
+            stats.summarized = any(str(m.get("content") or "").startswith("[历史摘要]") for m in messages)
+        stats.model_calls += 1
+        stats.prompt_tokens += main.estimate_tokens(messages)
+
+        recorded = self.replay.script.popleft() if self.replay.script else {"content": FALLBACK_ANSWER}
+        chunks = []
+        if recorded.get("reasoning_content"):
+            chunks.append(_chunk(reasoning_content=recorded["reasoning_content"]))
+        if recorded.get("content"):
+            chunks.append(_chunk(content=recorded["content"]))
+        for index, tc in enumerate(recorded.get("tool_calls") or []):
+            function = SimpleNamespace(name=tc["function"]["name"], arguments=tc["function"]["arguments"])
+            chunks.append(_chunk(tool_calls=[SimpleNamespace(index=index, id=tc["id"], function=function)]))
+        return FakeStream(chunks)
+
+    async def close(self):
+        pass
+
+
+def build_services(db_url: str, archive_dir: str, replay: Replay):
+    from db import DBService
+    from archive import SessionArchive
+    from formula import FormulaService
+
+    class ReplayDB(DBService):
+        async def get_history(self, session_id: str, limit: int = 100):
+            history = await super().get_history(session_id, limit)
+            if replay.stats:
+                replay.stats.history_rows += len(history)
+            return history
+
+    class ReplayFormula(FormulaService):
+        async def _load_formula_tools(self, uri: str):
+            return []
+
+        async def call_tool(self, function_name: str, args: dict, user_id: str = None, session_id: str = None):
+            if function_name == "store_hard_rule":
+                return await super().call_tool(function_name, args, user_id, session_id)
+            return replay.tool_outputs.popleft() if replay.tool_outputs else ""
+
+    class NoMemory:
+        async def search_memory(self, query, user_id, run_id):
+            return ""
+
+        async def add_memory(self, content, user_id, run_id):
+            pass
+
+    class NoTitles:
+        def enqueue(self, *args):
+            pass
+
+    db = ReplayDB(db_url, archive=SessionArchive(archive_dir) if archive_dir else None)
+    return db, ReplayFormula("http://replay.invalid", "", db), NoMemory(), NoTitles()
+
+
+def time_queries(db, replay: Replay):
+    from sqlalchemy import event
+
+    @event.listens_for(db.engine.sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(db.engine.sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        if replay.stats:
+            replay.stats.db_queries += 1
+            replay.stats.db_time += time.perf_counter() - started
+
+
+async def pick_sessions(db, count: int, session_ids: list):
+    from sqlalchemy import select, func
+    import schema
+    h, s = schema.conversation_history, schema.sessions
+    async with db.engine.connect() as conn:
+        if session_ids:
+            result = await conn.execute(select(s.c.id, s.c.user_id).where(s.c.id.in_(session_ids)))
+        else:
+            # Longest sessions first: they are where context costs show up
+            result = await conn.execute(
+                select(s.c.id, s.c.user_id)
+                .join(h, h.c.session_id == s.c.id)
+                .group_by(s.c.id, s.c.user_id)
+                .order_by(func.count().desc())
+                .limit(count)
+            )
+        return [tuple(row) for row in result]
+
+
+def split_turns(history: list) -> list:
+    """Group recorded messages into turns: a user message and what answered it."""
+    turns = []
+    for message in history:
+        if message["role"] == "user":
+            turns.append({"message": message["content"] or "", "assistant": [], "tool_outputs": [], "reasoning": False})
+        elif turns and message["role"] == "assistant":
+            turns[-1]["assistant"].append(message)
+            rc = message.get("reasoning_content")
+            if rc and rc != "Directly executing tools...":
+                turns[-1]["reasoning"] = True
+        elif turns and message["role"] == "tool":
+            turns[-1]["tool_outputs"].append(message.get("content") or "")
+    return turns
+
+
+async def replay_session(main, replay: Replay, user_id: str, session_id: str, max_turns: int):
+    recorded = await main.db_service.get_history(session_id, limit=1_000_000)
+    turns = split_turns(recorded)[:max_turns]
+    replay_id = f"replay-{session_id}"
+    await main.db_service.clear_session_data(user_id, replay_id)
+    await main.db_service.create_session(user_id, replay_id, "新对话")
+
+    results = []
+    for number, turn in enumerate(turns, 1):
+        message = turn["message"]
+        image = None
+        if message.startswith("[Image] "):
+            message, image = message[len("[Image] "):], PLACEHOLDER_IMAGE
+        request = main.ChatRequest(
+            message=message, sessionId=replay_id, userId=user_id, image=image,
+            reasoning=turn["reasoning"], useMemory=False
+        )
+        replay.begin(turn)
+        response = await main.chat(request)
+        errors = [chunk async for chunk in response.body_iterator if "[Backend Error" in chunk]
+        total = time.perf_counter() - replay.stats.started
+        stats = replay.stats.as_dict(total)
+        replay.stats = None
+        stats.update(session=session_id, turn=number, error=errors[0].strip() if errors else None)
+        results.append(stats)
+    return results
+
+
+async def run(args):
+    import main
+    from circuit_breaker import build_breakers
+    from db import sqlite_url
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "replay.db")
+        # Replay writes messages and may rehydrate archives, so never touch the snapshot
+        shutil.copyfile(args.snapshot, db_path)
+        archive_dir = None
+        if args.archive_dir:
+            archive_dir = os.path.join(tmp, "archive")
+            shutil.copytree(args.archive_dir, archive_dir)
+
+        replay = Replay()
+        main.db_service, main.formula_service, main.memory_service, main.title_service = \
+            build_services(sqlite_url(db_path), archive_dir, replay)
+        main.breakers = build_breakers({}, ["advanced", "fast", "mem0", "formula"])
+        main.model_clients.update(advanced=FakeModelClient(replay), fast=FakeModelClient(replay))
+        await main.db_service.init()
+        time_queries(main.db_service, replay)
+
+        results = []
+        try:
+            for session_id, user_id in await pick_sessions(main.db_service, args.sessions, args.session_id):
+                session_results = await replay_session(main, replay, user_id, session_id, args.max_turns)
+                results.extend(session_results)
+                report_session(session_id, session_results)
+        finally:
+            await main.db_service.close()
+    return results
+
+
+def report_session(session_id: str, results: list):
+    print(f"\nsession {session_id}: {len(results)} turns")
+    print(f"{'turn':>5} {'tokens':>8} {'msgs':>5} {'calls':>5} {'rows':>5} {'ctx ms':>8} {'db ms':>8} {'queries':>7} {'total ms':>9}")
+    for r in results:
+        flags = (" summarized" if r["summarized"] else "") + (f" {r['error']}" if r["error"] else "")
+        print(f"{r['turn']:>5} {r['prompt_tokens']:>8} {r['prompt_messages']:>5} {r['model_calls']:>5} "
+              f"{r['history_rows']:>5} {r['context_ms']:>8.2f} {r['db_ms']:>8.2f} {r['db_queries']:>7} {r['total_ms']:>9.2f}{flags}")
+
+
+def report_overall(results: list):
+    if not results:
+        print("no turns replayed")
+        return
+    print(f"\n{len(results)} turns overall")
+    for key in ("prompt_tokens", "history_rows", "context_ms", "db_ms", "total_ms"):
+        values = sorted(r[key] for r in results)
+        p95 = values[min(len(values) - 1, int(len(values) * 0.95))]
+        print(f"  {key:<14} median {statistics.median(values):>10.2f}   p95 {p95:>10.2f}   max {values[-1]:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("snapshot", help="path to an omnimind.db snapshot (left unmodified)")
+    parser.add_argument("--sessions", type=int, default=10, help="replay the N longest sessions")
+    parser.add_argument("--session-id", action="append", default=[], help="replay this session (repeatable)")
+    parser.add_argument("--max-turns", type=int, default=1_000_000)
+    parser.add_argument("--archive-dir", help="archive directory belonging to the snapshot")
+    parser.add_argument("--json", help="write per-turn results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report_overall(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
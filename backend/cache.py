@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+class VersionedCache:
+    """
+    Bounded in-process LRU cache whose entries are tagged with a version.
+
+    The version for a key comes from a shared source (the cache_versions table
+    in SQLite), so a write in any worker process bumps the version and every
+    other worker sees its cached entry as stale on the next lookup.
+    An optional TTL covers data whose source of truth lives outside the DB.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry_version, stored_at, value = entry
+            if entry_version != version or (self.ttl is not None and time.monotonic() - stored_at > self.ttl):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
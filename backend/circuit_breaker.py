@@ -0,0 +1,128 @@
+import contextlib
+import threading
+import time
+from collections import deque
+from logger import get_logger
+
+logger = get_logger("CircuitBreaker")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose breaker is open."""
+
+class CircuitBreaker:
+    """
+    Tracks the error rate and slow-call rate of one upstream over its last
+    `window` calls. When either reaches `error_rate` (with at least
+    `min_calls` samples) the breaker opens and callers fail fast for
+    `open_seconds`; then a single trial call is let through (half-open) and
+    its outcome closes or re-opens the breaker.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, error_rate: float = 0.5,
+                 slow_call_ms: float = 20000, open_seconds: float = 30):
+        self.name = name
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call_ms = slow_call_ms
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._calls = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self, latency_ms: float = 0):
+        self._record(True, latency_ms)
+
+    def record_failure(self, latency_ms: float = 0):
+        self._record(False, latency_ms)
+
+    def release(self):
+        """Give back a half-open trial slot without an outcome, e.g. when the client went away."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    @contextlib.asynccontextmanager
+    async def guard(self, upstream: str = None):
+        """
+        Run the body as one call through the breaker: raise CircuitOpenError
+        instead while it is open, record the body's outcome and latency, and
+        release the trial slot if the body is cancelled (the caller went away,
+        which says nothing about the upstream).
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"{upstream or self.name} circuit is open")
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.record_failure((time.monotonic() - started) * 1000)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record_success((time.monotonic() - started) * 1000)
+
+    def _record(self, ok: bool, latency_ms: float):
+        slow = latency_ms >= self.slow_call_ms
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if ok and not slow:
+                    self._close()
+                else:
+                    self._open("trial call failed")
+                return
+            self._calls.append((ok, slow))
+            if self.state == self.CLOSED and len(self._calls) >= self.min_calls:
+                failures = sum(1 for call_ok, _ in self._calls if not call_ok)
+                slow_calls = sum(1 for _, call_slow in self._calls if call_slow)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open(f"error rate {failures}/{len(self._calls)}")
+                elif slow_calls / len(self._calls) >= self.error_rate:
+                    self._open(f"slow calls {slow_calls}/{len(self._calls)}")
+
+    def _open(self, reason: str):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        logger.warning("Circuit for %s opened: %s", self.name, reason)
+
+    def _close(self):
+        self.state = self.CLOSED
+        self._calls.clear()
+        logger.info("Circuit for %s closed", self.name)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = list(self._calls)
+        return {
+            "state": self.state,
+            "calls": len(calls),
+            "failures": sum(1 for ok, _ in calls if not ok),
+            "slow": sum(1 for _, slow in calls if slow),
+        }
+
+def guarded(breaker, upstream: str = None):
+    """breaker.guard(upstream), or no protection for services built without a breaker."""
+    return breaker.guard(upstream) if breaker else contextlib.nullcontext()
+
+def build_breakers(resilience_config: dict, names) -> dict:
+    """One breaker per upstream; resilience.upstreams.<name> overrides resilience.breaker defaults."""
+    defaults = resilience_config.get("breaker", {})
+    overrides = resilience_config.get("upstreams", {})
+    return {name: CircuitBreaker(name, **{**defaults, **overrides.get(name, {})}) for name in names}
@@ -1,19 +1,20 @@
-import httpx
+import asyncio
 import json
 from logger import get_logger
+from cache import VersionedCache
+from circuit_breaker import guarded
 
 logger = get_logger("FormulaService")
 
 class FormulaService:
-    def __init__(self, base_url: str, api_key: str, db_service: any = None):
+    def __init__(self, base_url: str, api_key: str, db_service: any = None, tools_cache_ttl: float = 300.0, breaker=None):
         self.base_url = base_url
         self.api_key = api_key
         self.db_service = db_service
-        self.client = httpx.Client(
-            base_url=base_url,
-            headers={"Authorization": f"Bearer {api_key}"},
-            timeout=60.0,
-        )
+        self.breaker = breaker
+        self._client = None
+        # Tool catalogs live on the formula server, so workers refresh them by TTL
+        self.tools_cache = VersionedCache(max_entries=64, ttl=tools_cache_ttl)
         self.formula_uris = [
             "moonshot/date:latest",
             "moonshot/web-search:latest"
@@ -39,22 +40,48 @@ class FormulaService:
             }
         ]
 
+    @property
+    def client(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=60.0,
+            )
+        return self._client
+
+    async def _request(self, method: str, path: str, **kwargs):
+        """Call the formula server, failing fast while its circuit is open"""
+        async with guarded(self.breaker, "Formula server"):
+            response = await self.client.request(method, path, **kwargs)
+            response.raise_for_status()
+        return response
+
+    async def _load_formula_tools(self, uri: str):
+        tools = self.tools_cache.get(uri)
+        if tools is not None:
+            return tools
+        try:
+            response = await self._request("GET", f"/formulas/{uri}/tools")
+            tools = response.json().get("tools", [])
+            self.tools_cache.set(uri, tools)
+            return tools
+        except Exception as e:
+            logger.warning("Failed to load tools from %s: %s", uri, e)
+            return []
+
     async def get_tools(self):
         all_tools = list(self.local_tools)
-        for uri in self.formula_uris:
-            try:
-                response = self.client.get(f"/formulas/{uri}/tools")
-                response.raise_for_status()
-                tools = response.json().get("tools", [])
-                for tool in tools:
-                    func = tool.get("function")
-                    if func:
-                        func_name = func.get("name")
-                        if func_name:
-                            self.tool_to_uri[func_name] = uri
-                            all_tools.append(tool)
-            except Exception as e:
-                logger.warning(f"Failed to load tools from {uri}: {e}")
+        catalogs = await asyncio.gather(*(self._load_formula_tools(uri) for uri in self.formula_uris))
+        for uri, tools in zip(self.formula_uris, catalogs):
+            for tool in tools:
+                func = tool.get("function")
+                if func:
+                    func_name = func.get("name")
+                    if func_name:
+                        self.tool_to_uri[func_name] = uri
+                        all_tools.append(tool)
         return all_tools
 
     async def call_tool(self, function_name: str, args: dict, user_id: str = None, session_id: str = None):
@@ -70,7 +97,7 @@ class FormulaService:
                 return f"Error: Missing required context. content={content}, userId={u_id}, sessionId={s_id}"
             
             try:
-                self.db_service.save_hard_rule(u_id, s_id, content)
+                await self.db_service.save_hard_rule(u_id, s_id, content)
                 return f"Successfully stored hard rule: {content}"
             except Exception as e:
                 return f"Error storing hard rule: {str(e)}"
@@ -78,23 +105,20 @@ class FormulaService:
         if not uri:
             raise ValueError(f"Unknown tool: {function_name}")
             
-        async with httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={"Authorization": f"Bearer {self.api_key}"},
-            timeout=60.0
-        ) as client:
-            response = await client.post(
-                f"/formulas/{uri}/fibers",
-                json={"name": function_name, "arguments": json.dumps(args)},
-            )
-            response.raise_for_status()
-            fiber = response.json()
-            
-            if fiber.get("status") == "succeeded":
-                return fiber["context"].get("output") or fiber["context"].get("encrypted_output")
-            
-            error_data = fiber.get("error") or fiber.get("context", {}).get("error")
-            return f"Error: {error_data or 'Unknown error'}"
+        response = await self._request(
+            "POST",
+            f"/formulas/{uri}/fibers",
+            json={"name": function_name, "arguments": json.dumps(args)},
+        )
+        fiber = response.json()
+        
+        if fiber.get("status") == "succeeded":
+            return fiber["context"].get("output") or fiber["context"].get("encrypted_output")
+        
+        error_data = fiber.get("error") or fiber.get("context", {}).get("error")
+        return f"Error: {error_data or 'Unknown error'}"
 
-    def close(self):
-        self.client.close()
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
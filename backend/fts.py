@@ -0,0 +1,63 @@
+import re
+
+# Tool outputs are large and rarely what users look for
+INDEXED_ROLES = ("user", "assistant")
+DEFAULT_TITLE = "新对话"
+
+# CJK ideographs, kana and hangul have no spaces between words. SQLite's unicode61
+# tokenizer would index a whole run as one token, so runs are split into overlapping
+# bigrams before indexing and querying; everything else is left to unicode61.
+CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+")
+
+def segment(text: str) -> str:
+    """Rewrite text so that each CJK run becomes space-separated bigrams."""
+    def bigrams(match):
+        run = match.group(0)
+        if len(run) == 1:
+            return f" {run} "
+        return " " + " ".join(run[i:i + 2] for i in range(len(run) - 1)) + " "
+    return CJK_RUN.sub(bigrams, text or "")
+
+def desegment(tokens: str) -> str:
+    """Approximate inverse of segment(), used for snippets of archived messages."""
+    out = []
+    prev = None
+    for part in tokens.split():
+        if prev and len(part) == 2 and len(prev) == 2 and CJK_RUN.fullmatch(part) and CJK_RUN.fullmatch(prev) and part[0] == prev[1]:
+            out[-1] += part[1]
+        else:
+            out.append(part)
+        prev = part
+    return " ".join(out)
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+def match_query(query: str) -> str:
+    """
+    Build an FTS5 expression over the tokens column. Whitespace-separated terms
+    are ANDed; each term is matched as a phrase. A single CJK character becomes a
+    prefix query because it is only indexed as part of a bigram.
+    """
+    clauses = []
+    for term in query.split():
+        if len(term) == 1 and CJK_RUN.fullmatch(term):
+            clauses.append(f"{_phrase(term)}*")
+            continue
+        tokens = segment(term).split()
+        if tokens:
+            clauses.append(_phrase(" ".join(tokens)))
+    return " AND ".join(clauses)
+
+def column_filter(column: str, value: str) -> str:
+    return f"{column} : {_phrase(value)}"
+
+def make_snippet(text: str, query: str, width: int = 60) -> str:
+    """A window of text around the first occurrence of any query term."""
+    text = " ".join((text or "").split())
+    lowered = text.lower()
+    positions = [lowered.find(term.lower()) for term in query.split()]
+    positions = [p for p in positions if p >= 0]
+    start = max(0, min(positions) - width // 3) if positions else 0
+    end = min(len(text), start + width)
+    return ("…" if start > 0 else "") + text[start:end] + ("…" if end < len(text) else "")
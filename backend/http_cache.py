@@ -0,0 +1,54 @@
+import gzip
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import orjson
+from fastapi import Request, Response
+
+# Bodies smaller than this are not worth the gzip CPU
+GZIP_MIN_SIZE = 1024
+
+def make_etag(kind: str, version: int) -> str:
+    return f'W/"{kind}-{version}"'
+
+def _http_date(dt: datetime) -> str:
+    if dt.tzinfo is None:
+        # CURRENT_TIMESTAMP is stored as naive UTC
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt, usegmt=True)
+
+def _validator_headers(etag: str, last_modified: datetime = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if last_modified:
+        headers["Last-Modified"] = _http_date(last_modified)
+    return headers
+
+def is_not_modified(request: Request, etag: str, last_modified: datetime = None) -> bool:
+    """If-None-Match takes precedence over If-Modified-Since (RFC 9110)."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: ignore the W/ prefix, e.g. after a proxy rewrote it
+        return "*" in candidates or etag.removeprefix("W/") in [c.removeprefix("W/") for c in candidates]
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        changed = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+        return changed.replace(microsecond=0) <= since
+    return False
+
+def not_modified_response(etag: str, last_modified: datetime = None) -> Response:
+    return Response(status_code=304, headers=_validator_headers(etag, last_modified))
+
+def json_response(request: Request, data, etag: str, last_modified: datetime = None) -> Response:
+    """Serialize with orjson and gzip large bodies when the client accepts it."""
+    # Row keys from SQLAlchemy are str subclasses (quoted_name), which orjson only accepts with this option
+    body = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+    headers = _validator_headers(etag, last_modified)
+    if len(body) >= GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=5)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,35 @@
+import os
+import threading
+import time
+
+# Crockford base32, as used by ULID: sorts the same as the underlying number
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_lock = threading.Lock()
+_last_ms = 0
+_last_random = 0
+
+def new_id() -> str:
+    """
+    ULID-style id: 48-bit millisecond timestamp then 80 random bits, 26 characters.
+    Ids sort by creation time, and within one millisecond the random part is
+    incremented so ids from this process stay strictly increasing. With 80 random
+    bits per millisecond, collisions across workers are not a practical concern.
+    """
+    global _last_ms, _last_random
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms <= _last_ms:
+            # Same millisecond, or the clock stepped back: keep counting up
+            now_ms = _last_ms
+            random_part = _last_random + 1
+            if random_part >> 80:
+                now_ms, random_part = now_ms + 1, 0
+        else:
+            random_part = int.from_bytes(os.urandom(10), "big")
+        _last_ms, _last_random = now_ms, random_part
+    value = (now_ms << 80) | random_part
+    chars = []
+    for _ in range(26):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return "".join(reversed(chars))
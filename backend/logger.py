@@ -1,28 +1,187 @@
+import atexit
+import contextvars
+import json
 import logging
+import os
+import queue
+import random
 import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Correlation ids attached to every record logged while they are set
+request_id_var = contextvars.ContextVar("request_id", default=None)
+session_id_var = contextvars.ContextVar("session_id", default=None)
+turn_id_var = contextvars.ContextVar("turn_id", default=None)
+CONTEXT_VARS = {"request_id": request_id_var, "session_id": session_id_var, "turn_id": turn_id_var}
+
+# Attributes every LogRecord has; anything else came in through extra= and is emitted as a field
+# (uvicorn adds color_message, an ANSI-colored copy of the message)
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample_rate", "color_message", *CONTEXT_VARS}
+
+# uvicorn installs its own stream handlers on these before importing the app
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+_settings = {
+    "level": os.getenv("AIMIN_LOG_LEVEL", "INFO").upper(),
+    "format": os.getenv("AIMIN_LOG_FORMAT", "json"),
+    "debug_sample_rate": 1.0,
+    "queue_size": 10000,
+}
+_queue = None
+_queue_handler = None
+_listener = None
+_lock = threading.Lock()
+
+@contextmanager
+def log_context(**ids):
+    """Bind request_id / session_id / turn_id for log records emitted inside the block."""
+    tokens = [(CONTEXT_VARS[name], CONTEXT_VARS[name].set(value)) for name, value in ids.items()]
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+def bind_context(**ids):
+    """Like log_context, for async generators where a with-block would span yields."""
+    for name, value in ids.items():
+        CONTEXT_VARS[name].set(value)
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for name in CONTEXT_VARS:
+            value = getattr(record, name, None)
+            if value:
+                entry[name] = value
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+    def format(self, record):
+        line = super().format(record)
+        ids = " ".join(f"{name}={getattr(record, name)}" for name in CONTEXT_VARS if getattr(record, name, None))
+        return f"{line} [{ids}]" if ids else line
+
+class _SamplingFilter(logging.Filter):
+    """Keeps a random share of records: extra={"sample_rate": r}, or debug_sample_rate for DEBUG."""
+    def filter(self, record):
+        rate = getattr(record, "sample_rate", None)
+        if rate is None and record.levelno <= logging.DEBUG:
+            rate = _settings["debug_sample_rate"]
+        return rate is None or rate >= 1 or random.random() < rate
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Runs in the caller's thread, so it only snapshots the context ids and enqueues.
+    Message formatting and the write to stdout happen on the listener thread; when
+    the queue is full the record is dropped rather than blocking the event loop.
+    """
+    dropped = 0
+
+    def prepare(self, record):
+        for name, var in CONTEXT_VARS.items():
+            if not hasattr(record, name):
+                setattr(record, name, var.get())
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _NonBlockingQueueHandler.dropped += 1
+
+class _Listener(QueueListener):
+    def enqueue_sentinel(self):
+        # Blocking is fine here: this only runs at shutdown, while the writer drains the queue
+        self.queue.put(self._sentinel)
+
+def _ensure_pipeline():
+    global _queue, _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return _queue_handler
+        _queue = queue.Queue(maxsize=_settings["queue_size"])
+        _queue_handler = _NonBlockingQueueHandler(_queue)
+        _queue_handler.addFilter(_SamplingFilter())
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if _settings["format"] == "json" else TextFormatter())
+        _listener = _Listener(_queue, stream_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _queue_handler
+
+def configure_logging(logging_config: dict):
+    """Apply the logging section of config.yaml; environment variables take precedence."""
+    _settings["level"] = os.getenv("AIMIN_LOG_LEVEL", logging_config.get("level", _settings["level"])).upper()
+    _settings["debug_sample_rate"] = logging_config.get("debug_sample_rate", _settings["debug_sample_rate"])
+    fmt = os.getenv("AIMIN_LOG_FORMAT", logging_config.get("format", _settings["format"]))
+    if _listener is not None and fmt != _settings["format"]:
+        for handler in _listener.handlers:
+            handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    _settings["format"] = fmt
+    for existing in logging.Logger.manager.loggerDict.values():
+        if isinstance(existing, logging.Logger) and _queue_handler in existing.handlers:
+            existing.setLevel(_settings["level"])
+    route_uvicorn_logs()
+
+def route_uvicorn_logs():
+    """
+    Send uvicorn's server and access logs through the queue as well, replacing
+    the synchronous handlers uvicorn configured; their levels stay as uvicorn set them.
+    """
+    handler = _ensure_pipeline()
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [handler]
+        uvicorn_logger.propagate = False
+
+def dropped_records() -> int:
+    """Records discarded since startup because the log queue was full."""
+    return _NonBlockingQueueHandler.dropped
+
+def shutdown_logging():
+    """Flush queued records; called at exit."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            dropped = dropped_records()
+            if dropped:
+                # Blocking put: the writer is still draining the queue
+                _queue.put(logging.makeLogRecord({
+                    "name": "Logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": "Dropped %d log records because the log queue was full", "args": (dropped,),
+                }))
+            _listener.stop()
+            _listener = None
 
 def get_logger(name: str):
     """
-    Returns a configured logger instance with a standardized format.
+    Returns a logger that hands records to the shared background writer.
+    Pass arguments %-style (logger.info("x %s", y)) so formatting is skipped
+    for filtered records and otherwise happens off the event loop.
     """
     logger = logging.getLogger(name)
-    
+
     # If the logger already has handlers, don't add more (prevents duplicate logs)
     if not logger.handlers:
-        logger.setLevel(logging.INFO)
-        
-        # Create console handler
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.INFO)
-        
-        # Create formatter and add it to the handler
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
-        handler.setFormatter(formatter)
-        
-        # Add the handler to the logger
-        logger.addHandler(handler)
-        
+        logger.setLevel(_settings["level"])
+        logger.addHandler(_ensure_pipeline())
+        logger.propagate = False
+
     return logger
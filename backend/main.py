@@ -1,19 +1,32 @@
 import os
 import json
 import asyncio
+import logging
+import time
+import uuid
+import secrets
+from collections import Counter
 from typing import List, Optional
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Header, Depends, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import openai
 from dotenv import load_dotenv
 
 from config_loader import load_config
-from db import DBService
+from db import DBService, sqlite_url
 from formula import FormulaService
 from memory_service import MemoryService
-from logger import get_logger
+from title_service import TitleService
+from archive import SessionArchive, ArchiveService
+from http_cache import make_etag, is_not_modified, not_modified_response, json_response
+from ids import new_id
+from ws_hub import ConnectionHub, ClientConnection
+from request_budget import RequestBudget, StreamOverflow
+from circuit_breaker import CircuitOpenError, build_breakers
+from profiling import LoopStallMonitor, RequestProfiler, sample_stacks, write_folded, profile_path
+from logger import get_logger, configure_logging, log_context, bind_context, dropped_records
 
 logger = get_logger("Main")
 
@@ -22,7 +35,188 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 dotenv_path = os.path.join(base_dir, "..", ".env.local")
 load_dotenv(dotenv_path=dotenv_path)
 
-app = FastAPI()
+# Configuration
+config = load_config()
+configure_logging(config.get("logging", {}))
+
+# Services are built in the lifespan below, so importing this module stays cheap
+db_service: DBService = None
+formula_service: FormulaService = None
+memory_service: MemoryService = None
+title_service: TitleService = None
+archive_service: ArchiveService = None
+model_clients = {}
+active_streams = 0
+breakers = {}
+loop_monitor: LoopStallMonitor = None
+hub = ConnectionHub()
+
+server_config = config.get("server", {})
+storage_config = config.get("storage", {})
+cache_config = config.get("cache", {})
+archive_config = config.get("archive", {})
+resilience_config = config.get("resilience", {})
+hedging_config = resilience_config.get("hedging", {})
+profiling_config = config.get("profiling", {})
+websocket_config = config.get("websocket", {})
+limits_config = config.get("limits", {})
+profile_dir = os.path.abspath(os.path.join(base_dir, "..", profiling_config.get("dir", "./profiles")))
+
+def get_model_client(kind: str):
+    """Return a shared AsyncOpenAI client for the configured model ("fast" or "advanced")."""
+    client = model_clients.get(kind)
+    if client is None:
+        import openai
+        client = openai.AsyncOpenAI(
+            api_key=config["models"][kind]["api_key"],
+            base_url=config["models"][kind]["base_url"]
+        )
+        model_clients[kind] = client
+    return client
+
+def get_storage_url() -> str:
+    """storage.url (or AIMIN_DB_URL) selects e.g. Postgres; otherwise SQLite at storage.sqlite_path."""
+    url = os.getenv("AIMIN_DB_URL") or storage_config.get("url")
+    if url:
+        return url
+    db_path = os.getenv("AIMIN_DB_PATH") or os.path.abspath(os.path.join(base_dir, "..", storage_config["sqlite_path"]))
+    return sqlite_url(db_path)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db_service, formula_service, memory_service, title_service, archive_service, breakers, loop_monitor
+    breakers = build_breakers(resilience_config, ["advanced", "fast", "mem0", "formula"])
+    archive_dir = os.path.abspath(os.path.join(base_dir, "..", archive_config.get("dir", "./archive")))
+    db_service = DBService(
+        get_storage_url(),
+        cache_size=cache_config.get("max_entries", 1024),
+        pool_size=storage_config.get("pool_size", 5),
+        archive=SessionArchive(archive_dir),
+        max_tool_output=limits_config.get("max_tool_output_kb", 64) * 1024
+    )
+    await db_service.init()
+    db_service.add_rules_listener(hub.rules_changed)
+    formula_service = FormulaService(
+        config["models"]["advanced"]["base_url"],
+        config["models"]["advanced"]["api_key"],
+        db_service,
+        tools_cache_ttl=cache_config.get("tools_ttl", 300),
+        breaker=breakers["formula"]
+    )
+    memory_service = MemoryService(
+        config["memory"]["mem0"]["api_key"],
+        db_service,
+        cache_ttl=cache_config.get("memory_ttl", 60),
+        breaker=breakers["mem0"]
+    )
+    title_config = config.get("titles", {})
+    title_service = TitleService(
+        config["models"]["fast"]["name"],
+        db_service,
+        lambda: get_model_client("fast"),
+        batch_size=title_config.get("batch_size", 8),
+        batch_window=title_config.get("batch_window_ms", 2000) / 1000,
+        breaker=breakers["fast"]
+    )
+    title_service.add_listener(hub.title_changed)
+    title_service.start()
+    if archive_config.get("enabled", False):
+        archive_service = ArchiveService(
+            db_service,
+            idle_days=archive_config.get("idle_days", 30),
+            interval=archive_config.get("interval_minutes", 60) * 60,
+            batch_size=archive_config.get("batch_size", 50)
+        )
+        archive_service.start()
+    if profiling_config.get("loop_stall_ms", 0) > 0:
+        loop_monitor = LoopStallMonitor(profiling_config["loop_stall_ms"])
+        loop_monitor.start()
+    app.state.ready = True
+    logger.info("Backend services initialized")
+    try:
+        yield
+    finally:
+        # uvicorn has already waited up to server.graceful_timeout for open
+        # requests (timeout_graceful_shutdown) before lifespan shutdown runs
+        app.state.ready = False
+        if active_streams:
+            logger.warning("Shutting down with %d streams still open", active_streams)
+        await title_service.stop()
+        if loop_monitor:
+            await loop_monitor.stop()
+        if archive_service:
+            await archive_service.stop()
+        await formula_service.close()
+        await db_service.close()
+        for client in model_clients.values():
+            await client.close()
+        model_clients.clear()
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
+
+class RequestIdMiddleware:
+    """Tags every log record of a request with its id (X-Request-ID from nginx, or a new one)."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-request-id", request_id.encode("latin-1")))
+            await send(message)
+
+        with log_context(request_id=request_id):
+            await self.app(scope, receive, send_with_id)
+
+def is_admin_token(token: str) -> bool:
+    expected = profiling_config.get("admin_token") or ""
+    # An unset ${AIMIN_ADMIN_TOKEN} stays as the literal placeholder and disables admin access
+    if not expected or expected.startswith("${") or not token:
+        return False
+    return secrets.compare_digest(token, expected)
+
+def require_admin(x_admin_token: str = Header(default="")):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="admin token required")
+
+class RequestProfilingMiddleware:
+    """cProfile one request when it carries X-Profile: 1 and a valid X-Admin-Token."""
+    def __init__(self, app):
+        self.app = app
+        self.profiler = RequestProfiler(profile_dir)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        if headers.get(b"x-profile") != b"1" or not is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+            return await self.app(scope, receive, send)
+        started = self.profiler.try_begin(scope["path"].strip("/").replace("/", "-"))
+        if started is None:
+            return await self.app(scope, receive, send)
+        profiler, path = started
+
+        async def send_with_path(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append((b"x-profile-file", os.path.basename(path).encode()))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_path)
+        finally:
+            self.profiler.finish(profiler)
+            await asyncio.to_thread(profiler.dump_stats, path)
+            logger.info("Saved request profile to %s", path)
+
+app.add_middleware(RequestProfilingMiddleware)
+# Added last so it runs outermost and the profiling log line carries the request id
+app.add_middleware(RequestIdMiddleware)
 
 # Add CORS Middleware
 app.add_middleware(
@@ -33,15 +227,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configuration
-config = load_config()
-db_service = DBService(os.path.abspath(os.path.join(base_dir, "..", config["storage"]["sqlite_path"])))
-formula_service = FormulaService(
-    config["models"]["advanced"]["base_url"],
-    config["models"]["advanced"]["api_key"],
-    db_service
-)
-memory_service = MemoryService(config["memory"]["mem0"]["api_key"])
+@app.get("/healthz")
+async def liveness():
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    if not app.state.ready:
+        raise HTTPException(status_code=503, detail="starting")
+    return {
+        "status": "ready",
+        "upstreams": {name: b.snapshot() for name, b in breakers.items()},
+        "logging": {"dropped_records": dropped_records()},
+    }
 
 class LoginRequest(BaseModel):
     username: str
@@ -55,27 +253,6 @@ class ChatRequest(BaseModel):
     useMemory: Optional[bool] = True
     recentContextCount: Optional[int] = 20  # -1 = unlimited, 0 = none
 
-async def summarize_session_title(session_id: str, user_msg: str, ai_msg: str):
-    try:
-        fast_client = openai.AsyncOpenAI(
-            api_key=config["models"]["fast"]["api_key"],
-            base_url=config["models"]["fast"]["base_url"]
-        )
-        prompt = f"请根据以下对话内容，总结一个简短的会话标题（不超过6个字）。只返回标题文字，不要有任何修饰语或标点。\n\n用户: {user_msg}\n助手: {ai_msg}"
-        
-        response = await fast_client.chat.completions.create(
-            model=config["models"]["fast"]["name"],
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=30
-        )
-        new_title = response.choices[0].message.content.strip().replace("“", "").replace("”", "").replace("标题：", "")
-        if new_title:
-            db_service.update_session_title(session_id, new_title)
-            return new_title
-    except Exception as e:
-        logger.warning(f"Failed to summarize title: {e}")
-    return None
-
 # Context Safety: Token estimation and history compression
 MAX_HISTORY_TOKENS = config.get("context", {}).get("max_history_tokens", 200000)
 
@@ -95,10 +272,7 @@ def estimate_tokens(messages: list) -> int:
 async def generate_history_summary(history: list) -> str:
     """Generate a summary of conversation history using fast model"""
     try:
-        fast_client = openai.AsyncOpenAI(
-            api_key=config["models"]["fast"]["api_key"],
-            base_url=config["models"]["fast"]["base_url"]
-        )
+        fast_client = get_model_client("fast")
         
         # Format history for summarization
         formatted = []
@@ -119,227 +293,273 @@ async def generate_history_summary(history: list) -> str:
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
-        logger.error(f"Failed to generate history summary: {e}")
+        logger.error("Failed to generate history summary: %s", e)
         return "历史对话摘要生成失败"
 
-@app.post("/chat")
-async def chat(request: ChatRequest):
-    async def event_generator():
+async def _first_chunk(kind: str, completion_args: dict):
+    """Open a completion stream and wait for its first chunk (None if the stream is empty)."""
+    stream = await get_model_client(kind).chat.completions.create(**completion_args)
+    try:
+        first = await stream.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await stream.close()
+        raise
+    return stream, first
+
+async def _guarded_first_chunk(kind: str, completion_args: dict, timeout: float = None):
+    """_first_chunk through the model's circuit breaker; time-to-first-token is the recorded latency."""
+    async with breakers[kind].guard(f"{kind} model"):
+        return await asyncio.wait_for(_first_chunk(kind, completion_args), timeout)
+
+async def _replay(first, stream):
+    try:
+        if first is not None:
+            yield first
+        async for chunk in stream:
+            yield chunk
+    finally:
+        # Release the upstream connection when the consumer stops early
+        await stream.close()
+
+async def open_model_stream(completion_args: dict, reasoning: bool, kind: str = "advanced"):
+    """
+    Start a streaming completion, returning (kind, chunks, hedged_because).
+    Non-reasoning requests are hedged onto the fast model when the advanced
+    breaker is open ("circuit_open") or its first token takes longer than
+    resilience.hedging.first_token_ms ("timeout"); otherwise hedged_because is None.
+    """
+    can_hedge = hedging_config.get("enabled", False) and not reasoning
+    hedged_because = None
+    if kind == "advanced":
+        timeout = hedging_config.get("first_token_ms", 8000) / 1000 if can_hedge else None
         try:
-            # Yield initial padding to bypass potential proxy buffering (e.g. Nginx, Cloudflare)
-            # This is ignored by the frontend parser as currentMode is null.
-            yield " " * 1024 + "\n"
-            
-            # 1. Retrieve memories and hard rules (Isolated by sessionId)
-            memories = ""
-            if request.useMemory:
-                yield "s:🔍 正在检索记忆与规则..."
-                # Run sync search in thread to avoid blocking event loop
-                memories = await asyncio.to_thread(
-                    memory_service.search_memory, 
-                    request.message, 
-                    request.userId, 
-                    request.sessionId
-                )
-            else:
-                yield "s:🔍 正在检索规则..."
-            
-            # Run sync DB calls in threads
-            hard_rules_list = await asyncio.to_thread(
-                db_service.get_hard_rules,
-                request.userId,
+            stream, first = await _guarded_first_chunk("advanced", completion_args, timeout)
+            return "advanced", _replay(first, stream), None
+        except (CircuitOpenError, asyncio.TimeoutError) as e:
+            if not can_hedge:
+                raise
+            hedged_because = "circuit_open" if isinstance(e, CircuitOpenError) else "timeout"
+            logger.warning("Hedging to fast model: %s", str(e) or type(e).__name__)
+
+    fast_args = {k: v for k, v in completion_args.items() if k != "extra_body"}
+    fast_args["model"] = config["models"]["fast"]["name"]
+    fast_args["max_tokens"] = min(completion_args["max_tokens"], hedging_config.get("fast_max_tokens", 8192))
+    stream, first = await _guarded_first_chunk("fast", fast_args)
+    return "fast", _replay(first, stream), hedged_because
+
+async def chat_events(request: ChatRequest):
+    """The /chat event stream: "s:", "t:" and "c:" prefixed chunks. Shared by HTTP and WebSocket."""
+    global active_streams
+    active_streams += 1
+    bind_context(session_id=request.sessionId, turn_id=uuid.uuid4().hex[:12])
+    budget = RequestBudget(
+        max_tool_output_kb=limits_config.get("max_tool_output_kb", 64),
+        tool_overflow=limits_config.get("tool_overflow", "truncate"),
+        max_stream_kb=limits_config.get("max_stream_kb", 512)
+    )
+    try:
+        # 1. Retrieve memories and hard rules (Isolated by sessionId)
+        memories = ""
+        if request.useMemory:
+            yield "s:🔍 正在检索记忆与规则..."
+            memories = await memory_service.search_memory(
+                request.message, 
+                request.userId, 
                 request.sessionId
             )
-            hard_rules_str = "\n".join([f"- {r['content']}" for r in hard_rules_list]) if hard_rules_list else "暂无本会话专有的硬性规则"
-            
-            # 2. Prepare context
-            system_prompt = (
-                f"你是 AiMin，一个人工智能助手。你具备长效记忆能力。\n"
-                f"当前用户 ID: {request.userId}\n"
-                f"当前会话 ID: {request.sessionId}\n"
-                "注意：你现在的记忆和规则是仅针对当前会话隔离的。\n\n"
-                "### [核心指令]\n"
-                "1. 你可以通过使用 `store_hard_rule` 工具来存储用户的“硬性契约”。当用户提出需要你永久记住、始终遵守的规则或身份设定时，请务必调用此工具进行存储。\n"
-                "2. 存储后的硬性契约将出现在下方的 [硬性契约] 栏目中，并具有最高执行优先级。\n"
-                "3. **即使处于非思考模式，也必须执行工具调用。**不要因为没有思考过程而忽略用户的存储请求。\n\n"
-
-                "### [多模态处理规则] 【新增模块：优先级仅次于用户显式指令】\n"
-                "#### 1. 输入预检（针对图片/文件）\n"
-                "当用户上传图片（或包含图片的消息）时，必须严格遵守以下判断流程：\n"
-                "   a. **指令优先（有Prompt）**：如果用户在上传图片时附带了具体指令（如“分析数据”、“翻译这个”），**直接依据图片内容执行该指令**。此时无需执行下方的 b/c 步骤，除非回答指令必须依赖文字识别。\n"
-                "   b. **内容嗅探（无Prompt）**：如果用户**仅上传图片且无具体指令**，请立即扫描图片，判断是否包含**主要信息载体为文字**的内容（如文档截图、诗词照片、幻灯片、代码截图）。\n"
-                "   c. **自动路由执行**：\n"
-                "      - 🔹 **若识别到有效文字**：判定为“用户希望处理文本”。请**静默读取**图片中的文字内容，并**立即将读取到的内容与 [硬性契约] 进行匹配**。若命中契约（例如“解释诗句”），直接执行契约逻辑；若未命中，则输出文字内容的简要摘要。\n"
-                "      - 🔹 **若无有效文字**（如风景、宠物、抽象图）：正常进行视觉美学描述或物体识别，不要强行寻找文字。\n"
-
-                "#### 2. 冲突解决\n"
-                "   - **指令 > 契约**：若 [硬性契约] 的默认行为与用户当前的显式指令冲突，以**当前指令为准**。（例：契约要求‘翻译英文’，但用户问‘字体的颜色是什么’，则回答颜色，不翻译）。\n"
-                "   - **异常处理**：若图片模糊导致文字无法辨认，直接简短告知用户：“图片文字太模糊，无法识别，请提供更清晰的版本。”\n\n"
-
-                f"### [硬性契约 (Hard Rules)]\n这些规则你必须无条件遵守，且优先级最高：\n{hard_rules_str}\n\n"
-                f"### [相关记忆 (Soft Facts)]\n这些是关于过去对话的上下文信息，供你参考：\n{memories or '暂无相关记忆'}"
-            )
-            history = db_service.get_history(request.sessionId)
-            
-            # History Repair: Remove failed turns (orphaned tool calls)
-            cleaned_history = []
-            idx = 0
-            while idx < len(history):
-                m = history[idx]
-                if m["role"] == "assistant" and m.get("tool_calls"):
-                    # Check for tool completion
-                    tool_call_ids = {tc["id"] for tc in m["tool_calls"]}
-                    found_tool_ids = set()
-                    search_idx = idx + 1
-                    tools_found = []
-                    while search_idx < len(history) and history[search_idx]["role"] == "tool":
-                        tid = history[search_idx].get("tool_call_id")
-                        if tid in tool_call_ids:
-                            found_tool_ids.add(tid)
-                            tools_found.append(history[search_idx])
-                        search_idx += 1
-                    
-                    if found_tool_ids == tool_call_ids:
-                        cleaned_history.append(m)
-                        cleaned_history.extend(tools_found)
-                        idx = search_idx
-                    else:
-                        # Orphan found! Strip the triggering user message too
-                        if cleaned_history and cleaned_history[-1]["role"] == "user":
-                            cleaned_history.pop()
-                        idx = search_idx # Skip assistant and any tool scraps
-                elif m["role"] == "tool":
-                    idx += 1 # Standalone tool scrap
-                else:
-                    cleaned_history.append(m)
-                    idx += 1
-            history = cleaned_history
-            
-            # Context Safety: Compress history if too long
-            history_tokens = estimate_tokens(history)
-            if history_tokens > MAX_HISTORY_TOKENS:
-                yield "s:📦 正在压缩历史对话..."
-                
-                # Try to get existing summary (in thread)
-                summary = await asyncio.to_thread(db_service.get_history_summary, request.sessionId)
-                
-                # Determine how many recent messages to keep
-                # If Unlimited (-1) or not set, default to 20 when compressing for safety
-                recent_count = request.recentContextCount
-                if recent_count == -1:
-                    recent_count = 20
-                elif recent_count <= 0:
-                    recent_count = 0
-                
-                if not summary:
-                    # Generate new summary (exclude recent messages that will be kept)
-                    to_summarize = history[:-recent_count] if recent_count > 0 else history
-                    summary = await generate_history_summary(to_summarize)
-                    # Save in thread
-                    await asyncio.to_thread(db_service.save_history_summary, request.sessionId, summary)
-                    logger.info(f"Generated and saved history summary for session {request.sessionId}")
+        else:
+            yield "s:🔍 正在检索规则..."
+        
+        hard_rules_list = await db_service.get_hard_rules(
+            request.userId,
+            request.sessionId
+        )
+        hard_rules_str = "\n".join([f"- {r['content']}" for r in hard_rules_list]) if hard_rules_list else "暂无本会话专有的硬性规则"
+        
+        # 2. Prepare context
+        system_prompt = (
+            f"你是 AiMin，一个人工智能助手。你具备长效记忆能力。\n"
+            f"当前用户 ID: {request.userId}\n"
+            f"当前会话 ID: {request.sessionId}\n"
+            "注意：你现在的记忆和规则是仅针对当前会话隔离的。\n\n"
+            "### [核心指令]\n"
+            "1. 你可以通过使用 `store_hard_rule` 工具来存储用户的“硬性契约”。当用户提出需要你永久记住、始终遵守的规则或身份设定时，请务必调用此工具进行存储。\n"
+            "2. 存储后的硬性契约将出现在下方的 [硬性契约] 栏目中，并具有最高执行优先级。\n"
+            "3. **即使处于非思考模式，也必须执行工具调用。**不要因为没有思考过程而忽略用户的存储请求。\n\n"
+
+            "### [多模态处理规则] 【新增模块：优先级仅次于用户显式指令】\n"
+            "#### 1. 输入预检（针对图片/文件）\n"
+            "当用户上传图片（或包含图片的消息）时，必须严格遵守以下判断流程：\n"
+            "   a. **指令优先（有Prompt）**：如果用户在上传图片时附带了具体指令（如“分析数据”、“翻译这个”），**直接依据图片内容执行该指令**。此时无需执行下方的 b/c 步骤，除非回答指令必须依赖文字识别。\n"
+            "   b. **内容嗅探（无Prompt）**：如果用户**仅上传图片且无具体指令**，请立即扫描图片，判断是否包含**主要信息载体为文字**的内容（如文档截图、诗词照片、幻灯片、代码截图）。\n"
+            "   c. **自动路由执行**：\n"
+            "      - 🔹 **若识别到有效文字**：判定为“用户希望处理文本”。请**静默读取**图片中的文字内容，并**立即将读取到的内容与 [硬性契约] 进行匹配**。若命中契约（例如“解释诗句”），直接执行契约逻辑；若未命中，则输出文字内容的简要摘要。\n"
+            "      - 🔹 **若无有效文字**（如风景、宠物、抽象图）：正常进行视觉美学描述或物体识别，不要强行寻找文字。\n"
+
+            "#### 2. 冲突解决\n"
+            "   - **指令 > 契约**：若 [硬性契约] 的默认行为与用户当前的显式指令冲突，以**当前指令为准**。（例：契约要求‘翻译英文’，但用户问‘字体的颜色是什么’，则回答颜色，不翻译）。\n"
+            "   - **异常处理**：若图片模糊导致文字无法辨认，直接简短告知用户：“图片文字太模糊，无法识别，请提供更清晰的版本。”\n\n"
+
+            f"### [硬性契约 (Hard Rules)]\n这些规则你必须无条件遵守，且优先级最高：\n{hard_rules_str}\n\n"
+            f"### [相关记忆 (Soft Facts)]\n这些是关于过去对话的上下文信息，供你参考：\n{memories or '暂无相关记忆'}"
+        )
+        history = await db_service.get_history(request.sessionId)
+        
+        # History Repair: Remove failed turns (orphaned tool calls)
+        cleaned_history = []
+        idx = 0
+        while idx < len(history):
+            m = history[idx]
+            if m["role"] == "assistant" and m.get("tool_calls"):
+                # Check for tool completion
+                tool_call_ids = {tc["id"] for tc in m["tool_calls"]}
+                found_tool_ids = set()
+                search_idx = idx + 1
+                tools_found = []
+                while search_idx < len(history) and history[search_idx]["role"] == "tool":
+                    tid = history[search_idx].get("tool_call_id")
+                    if tid in tool_call_ids:
+                        found_tool_ids.add(tid)
+                        tools_found.append(history[search_idx])
+                    search_idx += 1
                 
-                # Reconstruct history: summary + recent messages
-                summary_msg = {"role": "assistant", "content": f"[历史摘要]\n{summary}"}
-                if recent_count > 0:
-                    history = [summary_msg] + history[-recent_count:]
+                if found_tool_ids == tool_call_ids:
+                    cleaned_history.append(m)
+                    cleaned_history.extend(tools_found)
+                    idx = search_idx
                 else:
-                    history = [summary_msg]
+                    # Orphan found! Strip the triggering user message too
+                    if cleaned_history and cleaned_history[-1]["role"] == "user":
+                        cleaned_history.pop()
+                    idx = search_idx # Skip assistant and any tool scraps
+            elif m["role"] == "tool":
+                idx += 1 # Standalone tool scrap
+            else:
+                cleaned_history.append(m)
+                idx += 1
+        history = cleaned_history
+        
+        # Context Safety: Compress history if too long
+        history_tokens = estimate_tokens(history)
+        if history_tokens > MAX_HISTORY_TOKENS:
+            yield "s:📦 正在压缩历史对话..."
             
-
-            user_msg_content = request.message
+            # Try to get existing summary (in thread)
+            summary = await db_service.get_history_summary(request.sessionId)
             
-            # In non-reasoning mode, inject hard rules directly into the user message
-            # This puts them closer in the attention window, forcing compliance
-            if not request.reasoning and hard_rules_list:
-                rules_reminder = "【系统提醒：在回复前，请严格遵守以下硬性契约】\n"
-                rules_reminder += "\n".join([f"• {r['content']}" for r in hard_rules_list])
-                rules_reminder += "\n\n---\n\n"
-                user_msg_content = rules_reminder + request.message
+            # Determine how many recent messages to keep
+            # If Unlimited (-1) or not set, default to 20 when compressing for safety
+            recent_count = request.recentContextCount
+            if recent_count == -1:
+                recent_count = 20
+            elif recent_count <= 0:
+                recent_count = 0
             
-            if request.image:
-                user_msg_content = [
-                    {"type": "image_url", "image_url": {"url": request.image}},
-                    {"type": "text", "text": (rules_reminder + (request.message or "描述图片")) if (not request.reasoning and hard_rules_list) else (request.message or "描述图片")}
-                ]
+            if not summary:
+                # Generate new summary (exclude recent messages that will be kept)
+                to_summarize = history[:-recent_count] if recent_count > 0 else history
+                summary = await generate_history_summary(to_summarize)
+                # Save in thread
+                await db_service.save_history_summary(request.sessionId, summary)
+                logger.info("Generated and saved history summary for session %s", request.sessionId)
             
-            current_messages = [
-                {"role": "system", "content": system_prompt},
-                *history,
-                {"role": "user", "content": user_msg_content}
+            # Reconstruct history: summary + recent messages
+            summary_msg = {"role": "assistant", "content": f"[历史摘要]\n{summary}"}
+            if recent_count > 0:
+                history = [summary_msg] + history[-recent_count:]
+            else:
+                history = [summary_msg]
+        
+
+        user_msg_content = request.message
+        
+        # In non-reasoning mode, inject hard rules directly into the user message
+        # This puts them closer in the attention window, forcing compliance
+        if not request.reasoning and hard_rules_list:
+            rules_reminder = "【系统提醒：在回复前，请严格遵守以下硬性契约】\n"
+            rules_reminder += "\n".join([f"• {r['content']}" for r in hard_rules_list])
+            rules_reminder += "\n\n---\n\n"
+            user_msg_content = rules_reminder + request.message
+        
+        if request.image:
+            user_msg_content = [
+                {"type": "image_url", "image_url": {"url": request.image}},
+                {"type": "text", "text": (rules_reminder + (request.message or "描述图片")) if (not request.reasoning and hard_rules_list) else (request.message or "描述图片")}
             ]
-            
-            # Save user message (in thread)
-            await asyncio.to_thread(
-                db_service.save_message,
-                request.userId,
-                request.sessionId, 
-                "user", 
-                f"[Image] {request.message}" if request.image else request.message
+        
+        # Built once in API shape and only appended to: every model call in the
+        # tool loop is sent this same list instead of a fresh copy
+        current_messages = [budget.hold({"role": "system", "content": system_prompt})]
+        for m in history:
+            current_messages.append(budget.hold(m))
+        current_messages.append(budget.hold({"role": "user", "content": user_msg_content}))
+        del history
+        
+        # Save user message
+        await db_service.save_message(
+            request.userId,
+            request.sessionId, 
+            "user", 
+            f"[Image] {request.message}" if request.image else request.message
+        )
+        await db_service.update_session_time(request.sessionId)
+        
+        available_tools = await formula_service.get_tools()
+        
+        iteration = 0
+        max_iterations = 10
+        
+        # Once hedged onto the fast model, the rest of the turn stays there
+        model_kind = "advanced"
+        
+        final_content = ""
+        while iteration < max_iterations:
+            iteration += 1
+            yield "s:🧠 正在思考中..." if request.reasoning else "s:⚡ 正在生成中..."
+
+
+            # Call Model
+            completion_args = {
+                "model": config["models"]["advanced"]["name"],
+                "messages": current_messages,
+                "stream": True,
+                "tools": available_tools,
+                "max_tokens": 1024 * 32,
+                "temperature": 1.0 if request.reasoning else 0.6,
+            }
+            if request.reasoning is False:
+                completion_args["extra_body"] = {
+                    "thinking": {"type": "disabled"}
+                }
+            else:
+                # Some models might need explicit enablement or specific extra_body
+                # but following the user's success example which doesn't have it.
+                pass
+
+            model_started = time.monotonic()
+            used_kind, response, hedged_because = await open_model_stream(completion_args, request.reasoning, model_kind)
+            logger.debug(
+                "Model %s first chunk after %.0f ms (iteration %d, %d messages)",
+                used_kind, (time.monotonic() - model_started) * 1000, iteration, len(current_messages)
             )
-            await asyncio.to_thread(db_service.update_session_time, request.sessionId)
-            
-            available_tools = await formula_service.get_tools()
-            
-            iteration = 0
-            max_iterations = 10
+            if used_kind != model_kind:
+                model_kind = used_kind
+                if hedged_because == "circuit_open":
+                    yield "s:⚠️ 主模型暂时不可用，已切换到快速模型..."
+                else:
+                    yield "s:⚠️ 主模型响应缓慢，已切换到快速模型..."
             
-            client = openai.AsyncOpenAI(
-                api_key=config["models"]["advanced"]["api_key"],
-                base_url=config["models"]["advanced"]["base_url"]
-            )
+            # Chunks are collected in lists and joined once: repeated += over a
+            # 32k-token response copies the whole string on every chunk
+            thought_parts = []
+            content_parts = []
+            tool_calls_map = {}
+            has_cleared_status = False
+            budget.reset_stream()
             
-            final_content = ""
-            while iteration < max_iterations:
-                iteration += 1
-                yield "s:🧠 正在思考中..." if request.reasoning else "s:⚡ 正在生成中..."
-                
-                # Strict sequence reconstruction for API request
-                request_messages = []
-                for m in current_messages:
-                    role = m["role"]
-                    content = m.get("content")
-                    msg = {"role": role, "content": content}
-                    
-                    if role == "assistant":
-                        # reasoning_content (Kimi requirement)
-                        rc = m.get("reasoning_content") or m.get("thought")
-                        if rc: msg["reasoning_content"] = rc
-                        if m.get("tool_calls"):
-                            msg["tool_calls"] = m["tool_calls"]
-                            # Ensure content is None if only tool_calls are present
-                            if not content: msg["content"] = None
-                    elif role == "tool":
-                        msg["tool_call_id"] = m.get("tool_call_id")
-                        msg["name"] = m.get("name")
-                    
-                    request_messages.append(msg)
-
-                # Call Model
-                completion_args = {
-                    "model": config["models"]["advanced"]["name"],
-                    "messages": request_messages,
-                    "stream": True,
-                    "tools": available_tools,
-                    "max_tokens": 1024 * 32,
-                    "temperature": 1.0 if request.reasoning else 0.6,
-                }
-                if request.reasoning is False:
-                    completion_args["extra_body"] = {
-                        "thinking": {"type": "disabled"}
-                    }
-                else:
-                    # Some models might need explicit enablement or specific extra_body
-                    # but following the user's success example which doesn't have it.
-                    pass
-
-                response = await client.chat.completions.create(**completion_args)
-                
-                current_thought = ""
-                current_content = ""
-                tool_calls_map = {}
-                has_cleared_status = False
-                
+            try:
                 async for chunk in response:
                     if not chunk.choices:
                         continue
@@ -361,11 +581,13 @@ async def chat(request: ChatRequest):
                         has_cleared_status = True
                     
                     if reasoning_chunk:
-                        current_thought += reasoning_chunk
+                        budget.buffer(reasoning_chunk)
+                        thought_parts.append(reasoning_chunk)
                         yield f"t:{reasoning_chunk}"
                         
                     if content_chunk:
-                        current_content += content_chunk
+                        budget.buffer(content_chunk)
+                        content_parts.append(content_chunk)
                         yield f"c:{content_chunk}"
                         
                     if delta.tool_calls:
@@ -379,84 +601,111 @@ async def chat(request: ChatRequest):
                             target = tool_calls_map[tc.index]
                             if tc.id: target["id"] += tc.id
                             if tc.function.name: target["function"]["name"] += tc.function.name
-                            if tc.function.arguments: target["function"]["arguments"] += tc.function.arguments
+                            if tc.function.arguments:
+                                budget.buffer(tc.function.arguments)
+                                target["function"]["arguments"] += tc.function.arguments
+            except StreamOverflow as e:
+                # Keep what arrived as the answer; half-streamed tool calls cannot be run
+                logger.warning("Stopping model stream: %s", e)
+                await response.aclose()
+                tool_calls_map = {}
+                content_parts.append("\n[回复超出长度上限，已截断]")
+                yield "c:\n[回复超出长度上限，已截断]\n"
 
-                tool_calls = list(tool_calls_map.values())
+            current_thought = "".join(thought_parts)
+            current_content = "".join(content_parts)
+            del thought_parts, content_parts
+            tool_calls = list(tool_calls_map.values())
+            
+            if tool_calls:
+                # Execute Tools
+                friendly_names = {
+                    "store_hard_rule": "存储硬性规则",
+                    "web_search": "网络搜索",
+                    "calculate": "数学计算"
+                }
+                tool_display_names = ", ".join([friendly_names.get(tc["function"]["name"], tc["function"]["name"]) for tc in tool_calls])
+                yield f"s:🛠️ 正在执行: {tool_display_names}..."
                 
-                if tool_calls:
-                    # Execute Tools
-                    friendly_names = {
-                        "store_hard_rule": "存储硬性规则",
-                        "web_search": "网络搜索",
-                        "calculate": "数学计算"
-                    }
-                    tool_display_names = ", ".join([friendly_names.get(tc["function"]["name"], tc["function"]["name"]) for tc in tool_calls])
-                    yield f"s:🛠️ 正在执行: {tool_display_names}..."
-                    
-                    assistant_msg = {
-                        "role": "assistant",
-                        "content": current_content or None,
-                        "reasoning_content": current_thought or "Directly executing tools...",
-                        "tool_calls": tool_calls
-                    }
-                    await asyncio.to_thread(
-                        db_service.save_message,
-                        request.userId,
-                        request.sessionId, "assistant", 
-                        assistant_msg["content"], assistant_msg["reasoning_content"], tool_calls
-                    )
-                    current_messages.append(assistant_msg)
+                assistant_msg = {
+                    "role": "assistant",
+                    "content": current_content or None,
+                    "reasoning_content": current_thought or "Directly executing tools...",
+                    "tool_calls": tool_calls
+                }
+                await db_service.save_message(
+                    request.userId,
+                    request.sessionId, "assistant", 
+                    assistant_msg["content"], assistant_msg["reasoning_content"], tool_calls
+                )
+                current_messages.append(budget.hold(assistant_msg))
+                
+                for tc in tool_calls:
+                    content = ""
+                    try:
+                        args = json.loads(tc["function"]["arguments"])
+                        result = await formula_service.call_tool(
+                            tc["function"]["name"], 
+                            args, 
+                            user_id=request.userId, 
+                            session_id=request.sessionId
+                        )
+                        content = str(result)
+                    except Exception as e:
+                        yield f"c:\n[Tool Error: {str(e)}]\n"
+                        content = f"Error: {str(e)}"
                     
-                    for tc in tool_calls:
-                        content = ""
-                        try:
-                            args = json.loads(tc["function"]["arguments"])
-                            result = await formula_service.call_tool(
-                                tc["function"]["name"], 
-                                args, 
-                                user_id=request.userId, 
-                                session_id=request.sessionId
-                            )
-                            content = str(result)
-                        except Exception as e:
-                            yield f"c:\n[Tool Error: {str(e)}]\n"
-                            content = f"Error: {str(e)}"
-                        
-                        meta = json.dumps({"id": tc["id"], "name": tc["function"]["name"]})
-                        await asyncio.to_thread(db_service.save_message, request.userId, request.sessionId, "tool", content, meta)
-                        current_messages.append({
-                            "role": "tool",
-                            "tool_call_id": tc["id"],
-                            "name": tc["function"]["name"],
-                            "content": content
-                        })
+                    content = budget.tool_output(content)
+                    meta = json.dumps({"id": tc["id"], "name": tc["function"]["name"]})
+                    await db_service.save_message(request.userId, request.sessionId, "tool", content, meta)
+                    current_messages.append(budget.hold({
+                        "role": "tool",
+                        "tool_call_id": tc["id"],
+                        "name": tc["function"]["name"],
+                        "content": budget.model_tool_content(content)
+                    }))
 
-                else:
-                    # Final Answer
-                    final_content = current_content
-                    await asyncio.to_thread(
-                        db_service.save_message,
-                        request.userId,
-                        request.sessionId, "assistant", current_content, current_thought
+            else:
+                # Final Answer
+                final_content = current_content
+                await db_service.save_message(
+                    request.userId,
+                    request.sessionId, "assistant", current_content, current_thought
+                )
+                # Save to Mem0
+                if request.useMemory:
+                    await memory_service.add_memory(
+                        f"User: {request.message}\nAssistant: {current_content}",
+                        user_id=request.userId,
+                        run_id=request.sessionId
                     )
-                    # Save to Mem0 (in thread)
-                    if request.useMemory:
-                        await asyncio.to_thread(
-                            memory_service.add_memory,
-                            f"User: {request.message}\nAssistant: {current_content}",
-                            user_id=request.userId,
-                            run_id=request.sessionId
-                        )
-                    break
-            
-            # 3. Check if we need to update session title
-            if not db_service.is_session_titled(request.sessionId):
-                new_title = await summarize_session_title(request.sessionId, request.message, final_content)
-                if new_title:
-                    yield f"u:{new_title}"
-                    
-        except Exception as e:
-            yield f"c:\n[Backend Error: {str(e)}]\n"
+                break
+        
+        # 3. Queue title generation for untitled sessions; the background worker
+        # batches them and clients pick the title up from /sessions
+        if not await db_service.is_session_titled(request.sessionId):
+            title_service.enqueue(request.userId, request.sessionId, request.message, final_content)
+                
+    except Exception as e:
+        yield f"c:\n[Backend Error: {str(e)}]\n"
+    finally:
+        active_streams -= 1
+        usage = budget.snapshot()
+        logger.log(
+            logging.INFO if usage["tool_outputs_capped"] else logging.DEBUG,
+            "Request held %d messages (%d bytes), peak response %d bytes, tool output %d bytes (%d capped)",
+            usage["messages_held"], usage["message_bytes"], usage["peak_stream_bytes"],
+            usage["tool_output_bytes"], usage["tool_outputs_capped"], extra=usage
+        )
+
+@app.post("/chat")
+async def chat(request: ChatRequest):
+    async def event_generator():
+        # Yield initial padding to bypass potential proxy buffering (e.g. Nginx, Cloudflare)
+        # This is ignored by the frontend parser as currentMode is null.
+        yield " " * 1024 + "\n"
+        async for event in chat_events(request):
+            yield event
 
     return StreamingResponse(
         event_generator(),
@@ -469,47 +718,159 @@ async def chat(request: ChatRequest):
         }
     )
 
+async def _run_ws_stream(connection: ClientConnection, stream_id: str, request: ChatRequest):
+    cancelled = False
+    try:
+        async for event in chat_events(request):
+            await connection.send({"type": "chunk", "id": stream_id, "data": event})
+    except asyncio.CancelledError:
+        cancelled = True
+    finally:
+        connection.streams.pop(stream_id, None)
+        if not connection.closed.is_set():
+            connection.push({"type": "done", "id": stream_id, "cancelled": cancelled})
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, userId: str):
+    """
+    One multiplexed connection per client. Client frames are JSON:
+      {"type": "chat", "id": <stream id>, "request": <ChatRequest without userId>}
+      {"type": "cancel", "id": <stream id>}
+      {"type": "pong"}
+    The server answers with {"type": "chunk", "id", "data"} frames carrying the same
+    "s:"/"t:"/"c:" chunks as /chat, then {"type": "done", "id", "cancelled"}. It also
+    pushes {"type": "u", "sessionId", "title"}, {"type": "rules", "sessionId"} and
+    {"type": "ping"} heartbeats.
+    """
+    if not websocket_config.get("enabled", False):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    connection = ClientConnection(websocket, userId, websocket_config.get("max_queue", 256))
+    hub.register(connection)
+    writer = asyncio.create_task(connection.run_writer())
+    heartbeat = asyncio.create_task(connection.run_heartbeat(
+        websocket_config.get("heartbeat_interval", 20), websocket_config.get("heartbeat_timeout", 60)
+    ))
+    closed = asyncio.create_task(connection.closed.wait())
+    max_streams = websocket_config.get("max_streams", 4)
+    try:
+        while True:
+            # receive() rather than receive_text(), which raises on a binary frame
+            receive = asyncio.create_task(websocket.receive())
+            done, _ = await asyncio.wait({receive, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if receive not in done:
+                receive.cancel()
+                break
+            message = receive.result()
+            if message["type"] == "websocket.disconnect":
+                break
+            connection.last_seen = time.monotonic()
+            frame = None
+            if message.get("text") is not None:
+                try:
+                    frame = json.loads(message["text"])
+                except ValueError:
+                    pass
+            if not isinstance(frame, dict):
+                # Binary, non-JSON and non-object frames are answered here; the
+                # connection and its other streams carry on
+                connection.push({"type": "error", "detail": "frames must be JSON objects"})
+                continue
+            kind = frame.get("type")
+            stream_id = str(frame.get("id", ""))
+            if kind == "chat":
+                if stream_id in connection.streams or len(connection.streams) >= max_streams:
+                    connection.push({"type": "error", "id": stream_id, "detail": "too many streams"})
+                    continue
+                try:
+                    request = ChatRequest(**{**frame.get("request", {}), "userId": userId})
+                except Exception as e:
+                    connection.push({"type": "error", "id": stream_id, "detail": str(e)})
+                    continue
+                connection.streams[stream_id] = asyncio.create_task(_run_ws_stream(connection, stream_id, request))
+            elif kind == "cancel" and stream_id in connection.streams:
+                connection.streams[stream_id].cancel()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unregister(connection)
+        connection.closed.set()
+        for task in list(connection.streams.values()):
+            task.cancel()
+        for task in (writer, heartbeat, closed):
+            task.cancel()
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
 @app.post("/login")
 async def login(request: LoginRequest):
     try:
-        user_id = db_service.get_or_create_user(request.username)
+        user_id = await db_service.get_or_create_user(request.username)
         return {"userId": user_id, "username": request.username}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/sessions/{user_id}")
-async def get_sessions(user_id: str):
+async def get_sessions(user_id: str, request: Request):
     try:
-        return db_service.get_user_sessions(user_id)
+        version, changed_at = await db_service.get_version_info(f"sessions:{user_id}")
+        etag = make_etag("sessions", version)
+        if is_not_modified(request, etag, changed_at):
+            return not_modified_response(etag, changed_at)
+        sessions = await db_service.get_user_sessions(user_id)
+        return json_response(request, sessions, etag, changed_at)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 class SessionCreateRequest(BaseModel):
     userId: str
-    sessionId: str
+    sessionId: Optional[str] = None  # assigned by the server when omitted
     title: str
 
 @app.post("/sessions")
 async def create_session(request: SessionCreateRequest):
     try:
-        db_service.create_session(request.userId, request.sessionId, request.title)
-        return {"success": True}
+        session_id = request.sessionId or new_id()
+        await db_service.create_session(request.userId, session_id, request.title)
+        return {"success": True, "sessionId": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/rules")
-async def get_rules(sessionId: str, userId: str):
+async def get_rules(sessionId: str, userId: str, request: Request):
     try:
-        rules = db_service.get_hard_rules(userId, sessionId)
-        return rules
+        # Rules are per user within a session, so the change counter is too
+        version, changed_at = await db_service.get_version_info(f"rules:{userId}:{sessionId}")
+        etag = make_etag("rules", version)
+        if is_not_modified(request, etag, changed_at):
+            return not_modified_response(etag, changed_at)
+        rules = await db_service.get_hard_rules(userId, sessionId)
+        return json_response(request, rules, etag, changed_at)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/history/{session_id}")
-async def get_chat_history(session_id: str):
+async def get_chat_history(session_id: str, request: Request):
     try:
-        history = db_service.get_full_history(session_id)
-        return history
+        # The per-session change counter answers revalidation without touching message rows
+        version, changed_at = await db_service.get_version_info(f"history:{session_id}")
+        etag = make_etag("history", version)
+        if is_not_modified(request, etag, changed_at):
+            return not_modified_response(etag, changed_at)
+        history = await db_service.get_full_history(session_id)
+        return json_response(request, history, etag, changed_at)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/search")
+async def search(userId: str, q: str, limit: int = 20, offset: int = 0):
+    try:
+        limit = max(1, min(limit, 100))
+        results, has_more = await db_service.search(userId, q, limit, max(0, offset))
+        return {"results": results, "has_more": has_more}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -520,7 +881,7 @@ class RuleDeleteRequest(BaseModel):
 @app.delete("/rules")
 async def delete_rule(request: RuleDeleteRequest):
     try:
-        db_service.delete_hard_rule(request.id)
+        await db_service.delete_hard_rule(request.id)
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -535,16 +896,64 @@ async def reset_chat(request: Request, background_tasks: BackgroundTasks):
             raise HTTPException(status_code=400, detail="sessionId and userId are required")
         
         # 1. Clear database data immediately (Fast)
-        db_service.clear_session_data(user_id, session_id)
+        await db_service.clear_session_data(user_id, session_id)
         
         # 2. Clear Mem0 memory in the background (Slow, external API)
-        logger.info(f"Scheduling background memory clearing for user: {user_id}, session: {session_id}")
+        logger.info("Scheduling background memory clearing for user: %s, session: %s", user_id, session_id)
         background_tasks.add_task(memory_service.clear_memory, user_id, session_id)
         
         return {"success": True}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def capture_profile(seconds: float = 10, interval_ms: float = 5):
+    """Sample every thread of this worker for `seconds` and save the stacks in folded format."""
+    seconds = min(max(seconds, 0.1), profiling_config.get("max_seconds", 60))
+    samples = await asyncio.to_thread(sample_stacks, seconds, max(interval_ms, 1) / 1000)
+    path = profile_path(profile_dir, "sample", "folded")
+    await asyncio.to_thread(write_folded, samples, path)
+    # Leaf frames approximate where time is spent, without opening the file
+    leaves = Counter()
+    for stack, count in samples.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return {
+        "file": path,
+        "pid": os.getpid(),
+        "samples": sum(samples.values()),
+        "top": leaves.most_common(20),
+    }
+
+@app.post("/admin/loop-monitor", dependencies=[Depends(require_admin)])
+async def start_loop_monitor(threshold_ms: float = 100):
+    global loop_monitor
+    if loop_monitor:
+        await loop_monitor.stop()
+    loop_monitor = LoopStallMonitor(threshold_ms)
+    loop_monitor.start()
+    return {"pid": os.getpid(), "running": True, "threshold_ms": threshold_ms}
+
+@app.delete("/admin/loop-monitor", dependencies=[Depends(require_admin)])
+async def stop_loop_monitor():
+    global loop_monitor
+    stalls = 0
+    if loop_monitor:
+        stalls = loop_monitor.stalls
+        await loop_monitor.stop()
+        loop_monitor = None
+    return {"pid": os.getpid(), "running": False, "stalls": stalls}
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    # Auto-reload only for local development; it doubles startup cost in production
+    reload = os.getenv("AIMIN_RELOAD", "").lower() in ("1", "true", "yes")
+    # Several workers share the SQLite file in WAL mode; caches stay coherent via cache_versions
+    workers = 1 if reload else int(os.getenv("AIMIN_WORKERS") or server_config.get("workers", 1))
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=reload,
+        workers=workers,
+        timeout_graceful_shutdown=server_config.get("graceful_timeout", 30)
+    )
\ No newline at end of file
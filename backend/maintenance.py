@@ -0,0 +1,40 @@
+"""
+Offline maintenance of the backend database. Stop the backend first: these
+commands hold the database's write lock for as long as they run.
+
+    python maintenance.py vacuum
+
+vacuum converts a SQLite file created before incremental auto-vacuum was enabled,
+so pages freed by session archival are returned to the filesystem. It rewrites
+the whole file once; files created since then need nothing.
+
+The database is the one main.py would use (AIMIN_DB_URL / AIMIN_DB_PATH or
+config.yaml); pass --db-url to point at another one.
+"""
+import argparse
+import asyncio
+import os
+from dotenv import load_dotenv
+
+from config_loader import load_config
+from db import DBService
+from transfer import storage_url
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+async def main(args):
+    load_dotenv(os.path.join(base_dir, "..", ".env.local"))
+    db = DBService(args.db_url or storage_url(load_config()))
+    await db.init()
+    try:
+        if args.command == "vacuum":
+            await db.enable_incremental_vacuum()
+    finally:
+        await db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline database maintenance; stop the backend first")
+    parser.add_argument("--db-url", help="SQLAlchemy URL; defaults to the backend's configured storage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("vacuum", help="convert a SQLite file to incremental auto-vacuum")
+    asyncio.run(main(parser.parse_args()))
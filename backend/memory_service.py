@@ -1,30 +1,72 @@
 import os
-from mem0 import MemoryClient
+import asyncio
+import threading
 from logger import get_logger
+from cache import VersionedCache
+from circuit_breaker import guarded
 
 logger = get_logger("MemoryService")
 
 class MemoryService:
-    def __init__(self, api_key: str):
-        self.client = MemoryClient(api_key=api_key)
+    def __init__(self, api_key: str, db_service=None, cache_ttl: float = 60.0, breaker=None):
+        self.api_key = api_key
+        self.db_service = db_service
+        self.breaker = breaker
+        # Mem0 extracts memories asynchronously, so cached searches also expire by TTL
+        self.search_cache = VersionedCache(max_entries=512, ttl=cache_ttl)
+        self._client = None
+        self._client_lock = threading.Lock()
 
-    def add_memory(self, content: str, user_id: str, run_id: str):
+    def _get_client(self):
+        # mem0 pulls in posthog, qdrant-client, grpcio and protobuf, and MemoryClient
+        # validates the API key over HTTP: only ever called from _call's worker thread
+        with self._client_lock:
+            if self._client is None:
+                from mem0 import MemoryClient
+                self._client = MemoryClient(api_key=self.api_key)
+            return self._client
+
+    async def _call(self, method: str, *args, **kwargs):
+        """
+        Run a sync Mem0 client method in a thread, failing fast while its circuit
+        is open. Building the client happens in the same thread and counts as
+        part of the call, so a failing construction also trips the breaker.
+        """
+        async with guarded(self.breaker, "Mem0"):
+            return await asyncio.to_thread(lambda: getattr(self._get_client(), method)(*args, **kwargs))
+
+    async def add_memory(self, content: str, user_id: str, run_id: str):
         """
         Add a memory for a specific user and session (run_id).
         """
         try:
-            self.client.add(content, user_id=user_id, run_id=run_id)
+            await self._call("add", content, user_id=user_id, run_id=run_id)
+            await self._invalidate(run_id)
         except Exception as e:
-            logger.error(f"Failed to add memory to Mem0: {e}")
+            logger.error("Failed to add memory to Mem0: %s", e)
 
-    def search_memory(self, query: str, user_id: str, run_id: str):
+    async def _version(self, run_id: str):
+        return await self.db_service.get_version(f"memory:{run_id}") if self.db_service else None
+
+    async def _invalidate(self, run_id: str):
+        if self.db_service:
+            await self.db_service.bump_version(f"memory:{run_id}")
+        else:
+            self.search_cache.clear()
+
+    async def search_memory(self, query: str, user_id: str, run_id: str):
         """
         Search memories for a specific user, isolated by run_id (sessionId).
         """
         try:
+            version = await self._version(run_id)
+            cached = self.search_cache.get((user_id, run_id, query), version)
+            if cached is not None:
+                return cached
+
             # Filters are required to isolate by run_id
             filters = {"run_id": run_id}
-            results = self.client.search(query, user_id=user_id, filters=filters)
+            results = await self._call("search", query, user_id=user_id, filters=filters)
             
             # Format results for prompt inclusion
             if not results:
@@ -35,7 +77,7 @@ class MemoryService:
                 results = results["results"]
                 
             if not isinstance(results, list):
-                logger.warning(f"Unexpected Mem0 search result format: {type(results)}")
+                logger.warning("Unexpected Mem0 search result format: %s", type(results))
                 return ""
                 
             memories = []
@@ -46,21 +88,24 @@ class MemoryService:
                 else:
                     memories.append(str(res))
                     
-            return "\n".join([f"- {m}" for m in memories])
+            formatted = "\n".join([f"- {m}" for m in memories])
+            self.search_cache.set((user_id, run_id, query), formatted, version)
+            return formatted
         except Exception as e:
-            logger.error(f"Failed to search memory in Mem0: {e}")
+            logger.error("Failed to search memory in Mem0: %s", e)
             return ""
 
-    def clear_memory(self, user_id: str, run_id: str = None):
+    async def clear_memory(self, user_id: str, run_id: str = None):
         """
         Clear memories for a user. If run_id is provided, only clear that session's memory.
         Note: Mem0 delete API might vary, using a simplified approach if direct filter delete isn't available.
         """
-        logger.info(f"Starting background memory clearing for user: {user_id}, session: {run_id}")
+        logger.info("Starting background memory clearing for user: %s, session: %s", user_id, run_id)
         try:
             # Mem0's delete often takes user_id, run_id isn't always a direct delete filter in all versions
             # but we follow the intent of clearing current session if possible.
-            self.client.delete_all(user_id=user_id, run_id=run_id)
-            logger.info(f"Successfully cleared memory for user: {user_id}, session: {run_id}")
+            await self._call("delete_all", user_id=user_id, run_id=run_id)
+            await self._invalidate(run_id)
+            logger.info("Successfully cleared memory for user: %s, session: %s", user_id, run_id)
         except Exception as e:
-            logger.error(f"Failed to clear memory in Mem0: {e}")
+            logger.error("Failed to clear memory in Mem0: %s", e)
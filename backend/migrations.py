@@ -0,0 +1,228 @@
+from sqlalchemy import inspect, select, func, text
+
+import fts
+import schema
+from logger import get_logger
+
+logger = get_logger("Migrations")
+
+def _add_missing_columns(conn, table, column_names):
+    """Add columns declared in schema.py that an older database is missing."""
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    for name in column_names:
+        if name in existing:
+            continue
+        col_type = table.c[name].type.compile(dialect=conn.dialect)
+        conn.execute(text(f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(name)} {col_type}"))
+        logger.info("Added column %s.%s", table.name, name)
+
+def _create_indexes(conn, table, index_names):
+    for index in table.indexes:
+        if index.name in index_names:
+            index.create(conn, checkfirst=True)
+
+def _initial_schema(conn):
+    core = [schema.users, schema.conversation_history, schema.hard_rules, schema.sessions]
+    schema.metadata.create_all(conn, tables=core, checkfirst=True)
+    # Databases created before columns were tracked may lack some of them
+    _add_missing_columns(conn, schema.conversation_history, ["user_id", "session_id"])
+    _add_missing_columns(conn, schema.hard_rules, ["user_id", "session_id", "is_active"])
+    _add_missing_columns(conn, schema.sessions, ["user_id", "title", "updated_at", "history_summary"])
+    _create_indexes(conn, schema.conversation_history, {"idx_history_session", "idx_history_user"})
+    _create_indexes(conn, schema.hard_rules, {"idx_rules_session", "idx_rules_user"})
+    _create_indexes(conn, schema.sessions, {"idx_sessions_user"})
+
+def _cache_versions(conn):
+    schema.cache_versions.create(conn, checkfirst=True)
+
+def _message_seq(conn):
+    _add_missing_columns(conn, schema.conversation_history, ["seq"])
+    h = schema.conversation_history
+    missing = conn.execute(select(func.count()).select_from(h).where(h.c.seq.is_(None))).scalar()
+    if missing and conn.dialect.name == "sqlite":
+        # rowid is the historical insertion order (only rowid tables can be missing seq)
+        conn.execute(text("UPDATE conversation_history SET seq = rowid WHERE seq IS NULL"))
+    _create_indexes(conn, schema.conversation_history, {"idx_history_session_seq"})
+
+def _session_archive(conn):
+    _add_missing_columns(conn, schema.sessions, ["archived_at"])
+    _create_indexes(conn, schema.sessions, {"idx_sessions_updated"})
+
+def _message_search(conn):
+    if conn.dialect.name != "sqlite":
+        # Postgres search falls back to ILIKE in DBService.search
+        return
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {schema.MESSAGE_FTS} USING fts5("
+        "tokens, user_id, session_id, message_id UNINDEXED, kind UNINDEXED, tokenize = 'unicode61')"
+    ))
+    if conn.execute(text(f"SELECT count(*) FROM {schema.MESSAGE_FTS}")).scalar():
+        return
+    insert = text(
+        f"INSERT INTO {schema.MESSAGE_FTS} (tokens, user_id, session_id, message_id, kind) "
+        "VALUES (:tokens, :user_id, :session_id, :message_id, :kind)"
+    )
+    h = schema.conversation_history
+    rows = conn.execute(
+        select(h.c.id, h.c.user_id, h.c.session_id, h.c.content)
+        .where(h.c.role.in_(fts.INDEXED_ROLES), h.c.content.isnot(None))
+    )
+    batch = []
+    for row in rows:
+        batch.append({"tokens": fts.segment(row.content), "user_id": row.user_id,
+                      "session_id": row.session_id, "message_id": row.id, "kind": "message"})
+        if len(batch) >= 1000:
+            conn.execute(insert, batch)
+            batch = []
+    s = schema.sessions
+    for row in conn.execute(select(s.c.id, s.c.user_id, s.c.title).where(s.c.title != fts.DEFAULT_TITLE)):
+        batch.append({"tokens": fts.segment(row.title), "user_id": row.user_id,
+                      "session_id": row.id, "message_id": row.id, "kind": "title"})
+    if batch:
+        conn.execute(insert, batch)
+
+def _version_timestamps(conn):
+    _add_missing_columns(conn, schema.cache_versions, ["updated_at"])
+
+def _archive_keys(conn):
+    _add_missing_columns(conn, schema.sessions, ["archive_key"])
+
+def _leases(conn):
+    schema.leases.create(conn, checkfirst=True)
+
+def _rehydration_times(conn):
+    _add_missing_columns(conn, schema.sessions, ["rehydrated_at"])
+
+def _exact_session_search(conn):
+    # unicode61 splits client-supplied session ids on punctuation, so a session_id
+    # column filter for "abc" also matched "abc-def". FTS5 cannot change a column in
+    # place: copy the index into a table where session_id is compared, not tokenized
+    if conn.dialect.name != "sqlite":
+        return
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE name = :name"), {"name": schema.MESSAGE_FTS}
+    ).scalar() or ""
+    if "session_id UNINDEXED" in sql:
+        return
+    rebuilt = f"{schema.MESSAGE_FTS}_rebuilt"
+    conn.execute(text(f"DROP TABLE IF EXISTS {rebuilt}"))
+    conn.execute(text(
+        f"CREATE VIRTUAL TABLE {rebuilt} USING fts5("
+        "tokens, user_id, session_id UNINDEXED, message_id UNINDEXED, kind UNINDEXED, tokenize = 'unicode61')"
+    ))
+    if sql:
+        conn.execute(text(
+            f"INSERT INTO {rebuilt} (tokens, user_id, session_id, message_id, kind) "
+            f"SELECT tokens, user_id, session_id, message_id, kind FROM {schema.MESSAGE_FTS}"
+        ))
+        conn.execute(text(f"DROP TABLE {schema.MESSAGE_FTS}"))
+    conn.execute(text(f"ALTER TABLE {rebuilt} RENAME TO {schema.MESSAGE_FTS}"))
+
+def _clustered_history(conn):
+    h = schema.conversation_history
+    if inspect(conn).get_pk_constraint(h.name)["constrained_columns"] == ["session_id", "seq"]:
+        return
+    if conn.dialect.name == "sqlite":
+        # SQLite cannot change a table's key in place: rebuild it as WITHOUT ROWID.
+        # Indexes keep their names across a rename, so drop them before recreating
+        conn.execute(text("ALTER TABLE conversation_history RENAME TO conversation_history_rowid"))
+        for name in ("idx_history_session", "idx_history_user", "idx_history_session_seq"):
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        h.create(conn)
+        # Rows from before per-user columns existed were added with NULL user_id and
+        # session_id, which the new table rejects. Take the owner from the session;
+        # rows that still have none were unreachable and are dropped
+        for table in ("conversation_history_rowid", schema.MESSAGE_FTS):
+            conn.execute(text(
+                f"UPDATE {table} SET user_id = (SELECT user_id FROM sessions WHERE sessions.id = {table}.session_id) "
+                "WHERE user_id IS NULL"
+            ))
+        orphans = conn.execute(text("DELETE FROM conversation_history_rowid WHERE user_id IS NULL")).rowcount
+        conn.execute(text(f"DELETE FROM {schema.MESSAGE_FTS} WHERE user_id IS NULL"))
+        if orphans:
+            logger.warning("Dropped %d messages that belong to no user", orphans)
+        # Sessionless rows are kept, unreachable as before; a NULL id never happened in
+        # practice but the id column used to allow it
+        fill = {"session_id": "COALESCE(session_id, '')", "id": "COALESCE(id, lower(hex(randomblob(13))))"}
+        columns = [c.name for c in h.c]
+        conn.execute(text(
+            f"INSERT INTO conversation_history ({', '.join(columns)}) "
+            f"SELECT {', '.join(fill.get(name, name) for name in columns)} "
+            "FROM conversation_history_rowid ORDER BY session_id, seq"
+        ))
+        conn.execute(text("DROP TABLE conversation_history_rowid"))
+        return
+    # Postgres keeps rows in a heap; CLUSTER orders it once and the key index serves range scans
+    pk_name = inspect(conn).get_pk_constraint(h.name)["name"]
+    conn.execute(text(f'ALTER TABLE conversation_history DROP CONSTRAINT "{pk_name}"'))
+    conn.execute(text("ALTER TABLE conversation_history ADD PRIMARY KEY (session_id, seq)"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_history_session"))
+    conn.execute(text("DROP INDEX IF EXISTS idx_history_session_seq"))
+    _create_indexes(conn, h, {"idx_history_id"})
+    conn.execute(text("CLUSTER conversation_history USING conversation_history_pkey"))
+
+# Ordered, append-only. Each step must be idempotent so a partially migrated
+# database can safely re-run it; concurrent workers are serialized by _lock.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "cache version counters", _cache_versions),
+    (3, "per-session message sequence", _message_seq),
+    (4, "cold session archive", _session_archive),
+    (5, "full-text message search", _message_search),
+    (6, "cache version timestamps", _version_timestamps),
+    (7, "session-clustered message table", _clustered_history),
+    (8, "archive blob keys", _archive_keys),
+    (9, "background job leases", _leases),
+    (10, "session rehydration times", _rehydration_times),
+    (11, "exact session ids in the search index", _exact_session_search),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(conn) -> int:
+    if not inspect(conn).has_table(schema.schema_migrations.name):
+        return 0
+    return conn.execute(select(func.max(schema.schema_migrations.c.version))).scalar() or 0
+
+# Arbitrary key for the Postgres advisory lock taken while migrating
+MIGRATION_LOCK_ID = 0x4F4D4E49
+
+def _lock(conn):
+    """
+    Hold the database's write lock until the migration transaction ends, so of
+    several workers starting together one migrates and the rest wait for it.
+    """
+    if conn.dialect.name == "sqlite":
+        # pysqlite opens transactions lazily and runs DDL outside them; take the
+        # write lock up front instead (waits up to the connection's busy timeout)
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    elif conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+
+def run_migrations(conn):
+    """
+    Apply pending migrations on a sync connection (use AsyncConnection.run_sync)
+    whose transaction has not written anything yet.
+    """
+    current = current_version(conn)
+    if current >= LATEST_VERSION:
+        logger.info("Schema version %s is current, skipping migrations", current)
+        return
+    _lock(conn)
+    # Another worker may have migrated while we waited for the lock
+    current = current_version(conn)
+    if current >= LATEST_VERSION:
+        logger.info("Schema version %s was migrated by another worker", current)
+        return
+    schema.schema_migrations.create(conn, checkfirst=True)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        step(conn)
+        recorded = conn.execute(
+            select(schema.schema_migrations.c.version).where(schema.schema_migrations.c.version == version)
+        ).first()
+        if not recorded:
+            conn.execute(schema.schema_migrations.insert().values(version=version, description=description))
+        logger.info("Applied migration %s: %s", version, description)
@@ -0,0 +1,138 @@
+import asyncio
+import cProfile
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from logger import get_logger
+
+logger = get_logger("Profiling")
+
+def profile_path(profile_dir: str, kind: str, suffix: str) -> str:
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return os.path.join(profile_dir, f"{kind}-{stamp}-pid{os.getpid()}.{suffix}")
+
+def _fold(frame) -> str:
+    """One stack in collapsed ("folded") form, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Counter:
+    """
+    Statistical profile of every thread in this process: snapshot all stacks every
+    `interval` seconds for `seconds`. Blocks the calling thread, so run it in a worker.
+    """
+    own_id = threading.get_ident()
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    samples = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                samples[f"{thread_names.get(thread_id, thread_id)};{_fold(frame)}"] += 1
+        time.sleep(interval)
+    return samples
+
+def write_folded(samples: Counter, path: str):
+    """Brendan Gregg's folded format, readable by flamegraph.pl and speedscope."""
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+
+class LoopStallMonitor:
+    """
+    Detects callbacks that block the event loop. A task on the loop refreshes a
+    heartbeat; a watchdog thread logs the loop thread's current stack whenever the
+    heartbeat is older than threshold_ms. Unlike asyncio debug mode this costs one
+    timer per interval, so it can stay on in production.
+    """
+    def __init__(self, threshold_ms: float = 100):
+        self.threshold = threshold_ms / 1000
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-stall-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._watchdog.join)
+        self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.threshold / 4)
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 4):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked < self.threshold or reported == beat:
+                continue
+            # Report each stall once, with the stack that is holding the loop
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            logger.warning("Event loop blocked for at least %.0f ms", blocked * 1000, extra={"stack": stack})
+
+class RequestProfiler:
+    """
+    cProfile around a single request, opted into with the X-Profile header.
+    Everything the event loop runs meanwhile is included, so results are
+    clearest on a quiet worker. Only one request is profiled at a time.
+    """
+    def __init__(self, profile_dir: str):
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+
+    def try_begin(self, label: str):
+        """Start profiling; returns (profiler, path) or None when a profile is already running."""
+        if not self._lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) already owns the hook
+            self._lock.release()
+            return None
+        safe_label = "".join(ch for ch in label if ch.isalnum() or ch in "-_")[:40]
+        return profiler, profile_path(self.profile_dir, f"request-{safe_label}", "prof")
+
+    def finish(self, profiler):
+        profiler.disable()
+        self._lock.release()
@@ -0,0 +1,96 @@
+def text_bytes(content) -> int:
+    """UTF-8 size of a message content: a string or a multi-modal part list."""
+    if isinstance(content, str):
+        return len(content.encode("utf-8"))
+    if isinstance(content, list):
+        total = 0
+        for item in content:
+            if isinstance(item, dict):
+                total += text_bytes(item.get("text") or item.get("image_url", {}).get("url") or "")
+        return total
+    return 0
+
+def preview(content: str, max_bytes: int, note: str) -> str:
+    """The head of content plus note, within max_bytes; cut without splitting a character."""
+    room = max(max_bytes - len(note.encode("utf-8")) - 1, 0)
+    return content.encode("utf-8")[:room].decode("utf-8", errors="ignore") + "\n" + note
+
+def tool_preview(content: str, max_bytes: int, size: int = None) -> str:
+    """
+    What the model sees of a stored tool output over max_bytes. size is the
+    full output's byte size, for callers that only loaded its head.
+    """
+    size = len(content.encode("utf-8")) if size is None else size
+    if not max_bytes or size <= max_bytes:
+        return content
+    return preview(content, max_bytes, f"[输出过长已截断：完整内容 {size} 字节已保存在对话记录中]")
+
+class StreamOverflow(Exception):
+    """Raised when one model response outgrows the per-request stream cap."""
+
+class RequestBudget:
+    """
+    Memory accounting for one chat request: bytes of model output buffered for
+    the current response, messages (and their bytes) held for the model context,
+    and tool output size. Caps are in KB; 0 disables a cap.
+
+    Tool outputs over `max_tool_output_kb` are cut to that size for the model.
+    With overflow "truncate" the stored message is cut too; with "reference"
+    the full output is stored (for export and the UI) and the model only ever
+    sees the preview, in this request and when the message is replayed from
+    history.
+    """
+    def __init__(self, max_tool_output_kb: int = 64, tool_overflow: str = "truncate", max_stream_kb: int = 512):
+        if tool_overflow not in ("truncate", "reference"):
+            raise ValueError(f"Unknown tool_overflow mode: {tool_overflow}")
+        self.max_tool_output = max_tool_output_kb * 1024
+        self.tool_overflow = tool_overflow
+        self.max_stream = max_stream_kb * 1024
+        self.stream_bytes = 0
+        self.peak_stream_bytes = 0
+        self.messages_held = 0
+        self.message_bytes = 0
+        self.tool_output_bytes = 0
+        self.tool_outputs_capped = 0
+
+    def hold(self, message: dict) -> dict:
+        """Count a message kept for the model context; returns it for chaining."""
+        self.messages_held += 1
+        self.message_bytes += text_bytes(message.get("content")) + text_bytes(message.get("reasoning_content"))
+        return message
+
+    def buffer(self, chunk: str):
+        self.stream_bytes += len(chunk.encode("utf-8"))
+        self.peak_stream_bytes = max(self.peak_stream_bytes, self.stream_bytes)
+        if self.max_stream and self.stream_bytes > self.max_stream:
+            raise StreamOverflow(f"response exceeded {self.max_stream // 1024} KB")
+
+    def reset_stream(self):
+        self.stream_bytes = 0
+
+    def tool_output(self, content: str) -> str:
+        """
+        The content to store for a fresh tool output. What the model sees is
+        derived from the stored content with model_tool_content.
+        """
+        size = len(content.encode("utf-8"))
+        self.tool_output_bytes += size
+        if not self.max_tool_output or size <= self.max_tool_output:
+            return content
+        self.tool_outputs_capped += 1
+        if self.tool_overflow == "reference":
+            return content
+        return preview(content, self.max_tool_output, f"[输出已截断：原始 {size} 字节]")
+
+    def model_tool_content(self, content: str) -> str:
+        """What the model sees of a fresh tool output; history is capped by DBService.get_history."""
+        return tool_preview(content, self.max_tool_output)
+
+    def snapshot(self) -> dict:
+        return {
+            "messages_held": self.messages_held,
+            "message_bytes": self.message_bytes,
+            "peak_stream_bytes": self.peak_stream_bytes,
+            "tool_output_bytes": self.tool_output_bytes,
+            "tool_outputs_capped": self.tool_outputs_capped,
+        }
@@ -0,0 +1,91 @@
+from sqlalchemy import (
+    MetaData, Table, Column, Text, Integer, BigInteger, DateTime, ForeignKey, Index, func
+)
+
+metadata = MetaData()
+
+users = Table(
+    "users", metadata,
+    Column("id", Text, primary_key=True),
+    Column("username", Text, unique=True, nullable=False),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+)
+
+# Keyed by (session_id, seq) and, on SQLite, stored WITHOUT ROWID: the table itself
+# is the b-tree on that key, so a session's messages sit together and reading
+# them is one contiguous range scan
+conversation_history = Table(
+    "conversation_history", metadata,
+    Column("id", Text, nullable=False),
+    Column("user_id", Text, ForeignKey("users.id"), nullable=False),
+    Column("session_id", Text, primary_key=True),
+    Column("role", Text, nullable=False),
+    Column("content", Text),
+    Column("thought", Text),
+    Column("tool_calls", Text),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+    # Insertion order within a session; replaces SQLite's rowid so ordering is portable
+    Column("seq", BigInteger, primary_key=True, autoincrement=False),
+    Index("idx_history_id", "id", unique=True),
+    Index("idx_history_user", "user_id"),
+    sqlite_with_rowid=False,
+)
+
+hard_rules = Table(
+    "hard_rules", metadata,
+    Column("id", Text, primary_key=True),
+    Column("user_id", Text, ForeignKey("users.id"), nullable=False),
+    Column("session_id", Text, nullable=False),
+    Column("content", Text, nullable=False),
+    Column("is_active", Integer, server_default="1"),
+    Column("created_at", DateTime, server_default=func.current_timestamp()),
+    Index("idx_rules_session", "session_id"),
+    Index("idx_rules_user", "user_id"),
+)
+
+sessions = Table(
+    "sessions", metadata,
+    Column("id", Text, primary_key=True),
+    Column("user_id", Text, ForeignKey("users.id"), nullable=False),
+    Column("title", Text, nullable=False),
+    Column("updated_at", DateTime, server_default=func.current_timestamp()),
+    Column("history_summary", Text),
+    # Set while the session's messages live in the cold archive instead of conversation_history
+    Column("archived_at", DateTime),
+    # SessionArchive key of that blob (NULL for blobs named after the session id)
+    Column("archive_key", Text),
+    # Last time the session was brought back from the archive; reading it counts as use
+    # for the archiver without moving it up the session list like updated_at would
+    Column("rehydrated_at", DateTime),
+    Index("idx_sessions_user", "user_id"),
+    Index("idx_sessions_updated", "updated_at"),
+)
+
+# Per-key version counters used to invalidate in-process caches across workers
+cache_versions = Table(
+    "cache_versions", metadata,
+    Column("key", Text, primary_key=True),
+    Column("version", BigInteger, nullable=False, server_default="0"),
+    # When the key last changed; served as Last-Modified by the read endpoints
+    Column("updated_at", DateTime),
+)
+
+# Time-limited ownership of background jobs that must run in one worker at a time
+leases = Table(
+    "leases", metadata,
+    Column("name", Text, primary_key=True),
+    Column("holder", Text, nullable=False),
+    Column("expires_at", DateTime, nullable=False),
+)
+
+schema_migrations = Table(
+    "schema_migrations", metadata,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("description", Text, nullable=False),
+    Column("applied_at", DateTime, server_default=func.current_timestamp()),
+)
+
+# SQLite FTS5 index over message content and session titles (see fts.py);
+# a virtual table, so it is created by migrations rather than declared here.
+# Only tokens and user_id are tokenized; filter the other columns with =
+MESSAGE_FTS = "message_fts"
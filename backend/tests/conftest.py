@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+# The backend is a flat set of modules run from backend/, not an installed package
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, BACKEND_DIR)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "omnimind.db")
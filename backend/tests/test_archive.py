@@ -0,0 +1,105 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+import schema
+from archive import SessionArchive
+from db import DBService, sqlite_url
+
+OLD = datetime(2020, 1, 1)
+CUTOFF = datetime(2021, 1, 1)
+
+
+def run(db_path: str, archive_dir: str, scenario):
+    """Run scenario(worker_a, worker_b): two DBServices sharing one database and archive."""
+    async def main():
+        workers = [DBService(sqlite_url(db_path), archive=SessionArchive(archive_dir)) for _ in range(2)]
+        try:
+            await workers[0].init()
+            user_id = await workers[0].get_or_create_user("alice")
+            await workers[0].create_session(user_id, "s", "新对话")
+            for content in ("one", "two", "three"):
+                await workers[0].save_message(user_id, "s", "user", content)
+            async with workers[0].engine.begin() as conn:
+                await conn.execute(update(schema.sessions).values(updated_at=OLD))
+            return await scenario(*workers)
+        finally:
+            for worker in workers:
+                await worker.close()
+    return asyncio.run(main())
+
+
+def blobs(archive_dir: str) -> list:
+    return sorted(os.listdir(archive_dir))
+
+
+def test_archive_and_rehydrate_round_trip(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+
+    async def scenario(a, b):
+        assert await a.archive_session("s", CUTOFF)
+        assert len(blobs(archive_dir)) == 1
+        return await b.get_history("s")
+    history = run(str(tmp_path / "db.sqlite"), archive_dir, scenario)
+    assert [m["content"] for m in history] == ["one", "two", "three"]
+    assert blobs(archive_dir) == []
+
+
+def test_stale_cold_list_does_not_touch_the_archived_blob(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+
+    async def scenario(a, b):
+        stale = await a.get_cold_sessions(CUTOFF)
+        assert await b.archive_session("s", CUTOFF)
+        archived = blobs(archive_dir)
+        for session_id in stale:
+            assert not await a.archive_session(session_id, CUTOFF)
+        assert blobs(archive_dir) == archived
+        return await a.get_history("s")
+    history = run(str(tmp_path / "db.sqlite"), archive_dir, scenario)
+    assert [m["content"] for m in history] == ["one", "two", "three"]
+
+
+def test_session_that_is_no_longer_cold_stays_hot(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+
+    async def scenario(a, b):
+        # updated_at is not before this cutoff, as if the session was just used
+        assert not await a.archive_session("s", OLD - timedelta(days=1))
+        assert blobs(archive_dir) == []
+        return await b.get_history("s")
+    history = run(str(tmp_path / "db.sqlite"), archive_dir, scenario)
+    assert [m["content"] for m in history] == ["one", "two", "three"]
+
+
+def test_missing_blob_leaves_the_session_archived(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+
+    async def scenario(a, b):
+        assert await a.archive_session("s", CUTOFF)
+        (blob,) = blobs(archive_dir)
+        os.rename(os.path.join(archive_dir, blob), os.path.join(str(tmp_path), blob))
+        assert await b.get_history("s") == []
+        os.rename(os.path.join(str(tmp_path), blob), os.path.join(archive_dir, blob))
+        return await b.get_history("s")
+    history = run(str(tmp_path / "db.sqlite"), archive_dir, scenario)
+    assert [m["content"] for m in history] == ["one", "two", "three"]
+
+
+def test_rehydration_keeps_session_order_and_is_not_rearchived(tmp_path):
+    archive_dir = str(tmp_path / "archive")
+
+    async def scenario(a, b):
+        user_id = await a.get_or_create_user("alice")
+        assert await a.archive_session("s", CUTOFF)
+        version = await b.get_version(f"sessions:{user_id}")
+        await b.get_full_history("s")
+        assert await b.get_version(f"sessions:{user_id}") == version
+        assert [row["updated_at"] for row in await b.get_user_sessions(user_id)] == [OLD]
+        # Read just now, so not cold even though it was last updated long ago
+        assert await a.get_cold_sessions(CUTOFF) == []
+        assert not await a.archive_session("s", CUTOFF)
+        assert await a.get_cold_sessions(datetime.utcnow() + timedelta(days=1)) == ["s"]
+    run(str(tmp_path / "db.sqlite"), archive_dir, scenario)
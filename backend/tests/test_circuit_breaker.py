@@ -0,0 +1,123 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from formula import FormulaService
+from memory_service import MemoryService
+
+OPEN_SECONDS = 0.05
+
+
+def make_breaker() -> CircuitBreaker:
+    return CircuitBreaker("test", window=4, min_calls=2, error_rate=0.5, slow_call_ms=1000, open_seconds=OPEN_SECONDS)
+
+
+def trip(breaker: CircuitBreaker):
+    """Open the breaker, then wait until it lets a trial call through."""
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    time.sleep(OPEN_SECONDS * 1.5)
+
+
+async def fail():
+    raise ConnectionError("upstream down")
+
+
+async def guarded_call(breaker: CircuitBreaker, body):
+    async with breaker.guard():
+        return await body()
+
+
+def test_error_rate_opens_the_breaker_and_calls_fail_fast():
+    breaker = make_breaker()
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            asyncio.run(guarded_call(breaker, fail))
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError, match="test circuit is open"):
+        asyncio.run(guarded_call(breaker, fail))
+    assert breaker.snapshot()["failures"] == 2
+
+
+def test_successful_trial_closes_the_breaker():
+    breaker = make_breaker()
+    trip(breaker)
+
+    async def ok():
+        return "ok"
+    assert asyncio.run(guarded_call(breaker, ok)) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    breaker = make_breaker()
+    trip(breaker)
+    with pytest.raises(ConnectionError):
+        asyncio.run(guarded_call(breaker, fail))
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_half_open_lets_one_trial_through_at_a_time():
+    breaker = make_breaker()
+    trip(breaker)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+def cancel_trial(breaker: CircuitBreaker, call):
+    """Start call() as the half-open trial and cancel it, as a client disconnect would."""
+    async def main():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    trip(breaker)
+    asyncio.run(main())
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+
+
+def test_cancelled_trial_releases_its_slot():
+    breaker = make_breaker()
+    cancel_trial(breaker, lambda: guarded_call(breaker, lambda: asyncio.sleep(10)))
+
+
+def test_cancelled_mem0_call_releases_its_slot():
+    breaker = make_breaker()
+
+    class SlowClient:
+        def search(self, *args, **kwargs):
+            # Outlives the cancellation; the worker thread itself cannot be stopped
+            time.sleep(0.2)
+            return []
+
+    service = MemoryService("key", breaker=breaker)
+    service._client = SlowClient()
+    cancel_trial(breaker, lambda: service._call("search", "query"))
+
+
+def test_cancelled_formula_call_releases_its_slot():
+    breaker = make_breaker()
+
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200)
+
+    service = FormulaService("http://formula.test", "key", breaker=breaker)
+
+    async def call():
+        service._client = httpx.AsyncClient(base_url=service.base_url, transport=httpx.MockTransport(slow))
+        try:
+            await service._request("GET", "/tools")
+        finally:
+            await service._client.aclose()
+    cancel_trial(breaker, call)
@@ -0,0 +1,122 @@
+import asyncio
+import sqlite3
+
+from db import DBService, sqlite_url
+
+
+def run(db_path: str, scenario, **options):
+    """Run scenario(db) against an initialized DBService on db_path."""
+    async def main():
+        db = DBService(sqlite_url(db_path), **options)
+        try:
+            await db.init()
+            return await scenario(db)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+
+def seqs(db_path: str, session_id: str) -> list:
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(
+        "SELECT seq FROM conversation_history WHERE session_id = ? ORDER BY seq", (session_id,)
+    ).fetchall()
+    conn.close()
+    return [row[0] for row in rows]
+
+
+def test_save_message_allocates_seq_per_session(db_path):
+    async def scenario(db):
+        user_id = await db.get_or_create_user("alice")
+        for session_id in ("a", "b"):
+            await db.create_session(user_id, session_id, "新对话")
+        for session_id in ("a", "a", "b", "a", "b"):
+            await db.save_message(user_id, session_id, "user", f"to {session_id}")
+    run(db_path, scenario)
+    assert seqs(db_path, "a") == [1, 2, 3]
+    assert seqs(db_path, "b") == [1, 2]
+
+
+def test_concurrent_saves_get_distinct_seqs(db_path):
+    async def scenario(db):
+        user_id = await db.get_or_create_user("alice")
+        await db.create_session(user_id, "s", "新对话")
+        await asyncio.gather(*(db.save_message(user_id, "s", "user", str(i)) for i in range(20)))
+        return await db.get_history("s")
+    history = run(db_path, scenario)
+    assert seqs(db_path, "s") == list(range(1, 21))
+    assert sorted(m["content"] for m in history) == sorted(str(i) for i in range(20))
+
+
+def test_history_is_returned_in_seq_order(db_path):
+    async def scenario(db):
+        user_id = await db.get_or_create_user("alice")
+        await db.create_session(user_id, "s", "新对话")
+        for content in ("one", "two", "three"):
+            await db.save_message(user_id, "s", "user", content)
+        return await db.get_history("s")
+    assert [m["content"] for m in run(db_path, scenario)] == ["one", "two", "three"]
+
+
+def test_history_previews_oversized_tool_output(db_path):
+    output = "数据" * 1000
+    async def scenario(db):
+        user_id = await db.get_or_create_user("alice")
+        await db.create_session(user_id, "s", "新对话")
+        await db.save_message(user_id, "s", "assistant", None, None, [{"id": "c1", "type": "function"}])
+        await db.save_message(user_id, "s", "tool", output, '{"id": "c1", "name": "search"}')
+        await db.save_message(user_id, "s", "tool", "short", '{"id": "c2", "name": "search"}')
+        await db.get_history("s")
+        return await db.get_history("s"), list(db.history_cache._entries.values())
+    history, cached = run(db_path, scenario, max_tool_output=1024)
+    call, long, short = history
+    assert call["content"] is None and "reasoning_content" not in call
+    assert len(long["content"].encode("utf-8")) <= 1024
+    assert long["content"].startswith("数据") and "6000 字节" in long["content"]
+    assert (long["tool_call_id"], long["name"]) == ("c1", "search")
+    assert short["content"] == "short"
+    assert all(len(m["content"] or "") <= 1024 for *_, entry in cached for m in entry)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT content FROM conversation_history WHERE role = 'tool' ORDER BY seq").fetchone()[0] == output
+    conn.close()
+
+
+def test_sqlite_connections_use_wal_and_pragmas(db_path):
+    async def scenario(db):
+        async with db.engine.connect() as conn:
+            return {
+                name: (await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+                for name in ("journal_mode", "synchronous", "auto_vacuum", "busy_timeout")
+            }
+    pragmas = run(db_path, scenario)
+    assert pragmas["journal_mode"] == "wal"
+    assert pragmas["synchronous"] == 1  # NORMAL
+    assert pragmas["auto_vacuum"] == 2  # INCREMENTAL
+    assert pragmas["busy_timeout"] == 30000
+
+
+def test_lease_has_one_holder_until_released_or_expired(db_path):
+    async def scenario(db):
+        assert await db.acquire_lease("job", "a", ttl=60)
+        assert not await db.acquire_lease("job", "b", ttl=60)
+        assert await db.acquire_lease("job", "a", ttl=60)
+        await db.release_lease("job", "a")
+        assert await db.acquire_lease("job", "b", ttl=-1)
+        # b's lease has already expired
+        assert await db.acquire_lease("job", "a", ttl=60)
+    run(db_path, scenario)
+
+
+def test_rule_versions_are_per_user_within_a_session(db_path):
+    async def scenario(db):
+        alice = await db.get_or_create_user("alice")
+        bob = await db.get_or_create_user("bob")
+        before = await db.get_version(f"rules:{bob}:s")
+        rule_id = await db.save_hard_rule(alice, "s", "用中文回答")
+        assert await db.get_version(f"rules:{alice}:s") == 1
+        assert await db.get_version(f"rules:{bob}:s") == before
+        assert await db.get_hard_rules(bob, "s") == []
+        await db.delete_hard_rule(rule_id)
+        assert await db.get_version(f"rules:{alice}:s") == 2
+        return await db.get_hard_rules(alice, "s")
+    assert run(db_path, scenario) == []
@@ -0,0 +1,144 @@
+import asyncio
+import sqlite3
+import subprocess
+import sys
+
+from sqlalchemy import inspect
+
+import migrations
+from db import DBService, sqlite_url
+from conftest import BACKEND_DIR
+
+# Schema written by the sqlite3-based DBService before migrations existed
+BASELINE_SCHEMA = """
+CREATE TABLE users (id TEXT PRIMARY KEY, username TEXT UNIQUE NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE conversation_history (
+    id TEXT PRIMARY KEY, user_id TEXT NOT NULL, session_id TEXT NOT NULL, role TEXT NOT NULL,
+    content TEXT, thought TEXT, tool_calls TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE hard_rules (
+    id TEXT PRIMARY KEY, user_id TEXT NOT NULL, session_id TEXT NOT NULL, content TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1, created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE sessions (
+    id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT NOT NULL,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP, history_summary TEXT
+);
+CREATE INDEX idx_history_session ON conversation_history (session_id);
+CREATE INDEX idx_history_user ON conversation_history (user_id);
+"""
+
+
+def make_baseline_db(path: str):
+    conn = sqlite3.connect(path)
+    conn.executescript(BASELINE_SCHEMA)
+    conn.execute("INSERT INTO users (id, username) VALUES ('u1', 'alice')")
+    conn.execute("INSERT INTO sessions (id, user_id, title) VALUES ('s1', 'u1', '新对话')")
+    for i, (role, content) in enumerate([("user", "你好"), ("assistant", "hi"), ("user", "again")]):
+        conn.execute(
+            "INSERT INTO conversation_history (id, user_id, session_id, role, content) VALUES (?, 'u1', 's1', ?, ?)",
+            (f"m{i}", role, content)
+        )
+    conn.commit()
+    conn.close()
+
+
+def init_db(path: str):
+    async def scenario():
+        db = DBService(sqlite_url(path))
+        try:
+            await db.init()
+            async with db.engine.connect() as conn:
+                return await conn.run_sync(lambda c: (
+                    migrations.current_version(c),
+                    inspect(c).get_pk_constraint("conversation_history")["constrained_columns"],
+                ))
+        finally:
+            await db.close()
+    return asyncio.run(scenario())
+
+
+def test_fresh_database_reaches_latest_version(db_path):
+    version, pk = init_db(db_path)
+    assert version == migrations.LATEST_VERSION
+    assert pk == ["session_id", "seq"]
+
+
+def test_rerun_is_a_no_op(db_path):
+    init_db(db_path)
+    assert init_db(db_path)[0] == migrations.LATEST_VERSION
+    conn = sqlite3.connect(db_path)
+    versions = [row[0] for row in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+    conn.close()
+    assert versions == [version for version, _, _ in migrations.MIGRATIONS]
+
+
+def test_baseline_database_is_upgraded_with_its_messages(db_path):
+    make_baseline_db(db_path)
+    version, pk = init_db(db_path)
+    assert version == migrations.LATEST_VERSION
+    assert pk == ["session_id", "seq"]
+
+    async def history():
+        db = DBService(sqlite_url(db_path))
+        try:
+            return await db.get_history("s1"), await db.search("u1", "你好")
+        finally:
+            await db.close()
+    messages, (hits, _) = asyncio.run(history())
+    assert [m["content"] for m in messages] == ["你好", "hi", "again"]
+    # Indexed by migration 5 and carried over when the index was rebuilt
+    assert [hit["message_id"] for hit in hits] == ["m0"]
+
+
+def test_concurrent_startup_migrates_once(db_path):
+    make_baseline_db(db_path)
+    script = (
+        "import asyncio, sys\n"
+        "from db import DBService, sqlite_url\n"
+        "async def main():\n"
+        "    db = DBService(sqlite_url(sys.argv[1]))\n"
+        "    await db.init()\n"
+        "    await db.close()\n"
+        "asyncio.run(main())\n"
+    )
+    workers = [
+        subprocess.Popen([sys.executable, "-c", script, db_path], cwd=BACKEND_DIR,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        for _ in range(4)
+    ]
+    errors = [w.communicate(timeout=60)[1].decode() for w in workers]
+    assert [w.returncode for w in workers] == [0] * 4, errors
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT count(*) FROM schema_migrations").fetchone()[0] == len(migrations.MIGRATIONS)
+    assert conn.execute("SELECT count(*) FROM conversation_history").fetchone()[0] == 3
+    conn.close()
+
+
+def test_messages_from_before_per_user_columns_are_kept_or_dropped(db_path):
+    # The baseline added user_id and session_id with ALTER TABLE ... TEXT, so
+    # rows written before that have NULLs in columns that are now NOT NULL
+    conn = sqlite3.connect(db_path)
+    conn.executescript(
+        BASELINE_SCHEMA
+        .replace("user_id TEXT NOT NULL, session_id TEXT NOT NULL, role", "role", 1)
+        .replace("CREATE INDEX idx_history_session ON conversation_history (session_id);", "")
+        .replace("CREATE INDEX idx_history_user ON conversation_history (user_id);", "")
+    )
+    conn.execute("INSERT INTO conversation_history (id, role, content) VALUES ('orphan', 'user', 'nobody')")
+    conn.execute("ALTER TABLE conversation_history ADD COLUMN user_id TEXT")
+    conn.execute("ALTER TABLE conversation_history ADD COLUMN session_id TEXT")
+    conn.execute("INSERT INTO users (id, username) VALUES ('u1', 'alice')")
+    conn.execute("INSERT INTO sessions (id, user_id, title) VALUES ('s1', 'u1', '新对话')")
+    conn.execute("INSERT INTO conversation_history (id, session_id, role, content) VALUES ('m1', 's1', 'user', 'hi')")
+    conn.execute(
+        "INSERT INTO conversation_history (id, user_id, session_id, role, content) VALUES ('m2', 'u1', 's1', 'assistant', 'hello')"
+    )
+    conn.commit()
+    conn.close()
+
+    assert init_db(db_path)[0] == migrations.LATEST_VERSION
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT id, user_id, session_id FROM conversation_history ORDER BY seq").fetchall()
+    conn.close()
+    assert rows == [("m1", "u1", "s1"), ("m2", "u1", "s1")]
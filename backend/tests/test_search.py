@@ -0,0 +1,51 @@
+import asyncio
+
+from db import DBService, sqlite_url
+
+
+def run(db_path: str, scenario):
+    """Run scenario(db, user_id) with sessions "abc" and "abc-def" that share their words."""
+    async def main():
+        db = DBService(sqlite_url(db_path))
+        try:
+            await db.init()
+            user_id = await db.get_or_create_user("alice")
+            for session_id in ("abc", "abc-def"):
+                await db.create_session(user_id, session_id, "新对话")
+                await db.update_session_title(session_id, f"天气 {session_id}")
+                await db.save_message(user_id, session_id, "user", "今天天气怎么样")
+            return await scenario(db, user_id)
+        finally:
+            await db.close()
+    return asyncio.run(main())
+
+
+def hits(results) -> list:
+    return sorted((hit["kind"], hit["session_id"]) for hit in results[0])
+
+
+def test_search_finds_titles_and_messages_of_the_user_only(db_path):
+    async def scenario(db, user_id):
+        other = await db.get_or_create_user("bob")
+        await db.create_session(other, "xyz", "新对话")
+        await db.save_message(other, "xyz", "user", "天气不错")
+        return await db.search(user_id, "天气"), await db.search(user_id, "怎么")
+    by_word, by_other_word = run(db_path, scenario)
+    assert hits(by_word) == [("message", "abc"), ("message", "abc-def"), ("title", "abc"), ("title", "abc-def")]
+    assert hits(by_other_word) == [("message", "abc"), ("message", "abc-def")]
+
+
+def test_clearing_a_session_leaves_sessions_with_similar_ids_indexed(db_path):
+    async def scenario(db, user_id):
+        await db.clear_session_data(user_id, "abc")
+        return await db.search(user_id, "怎么")
+    assert hits(run(db_path, scenario)) == [("message", "abc-def")]
+
+
+def test_retitling_a_session_leaves_sessions_with_similar_ids_indexed(db_path):
+    async def scenario(db, user_id):
+        await db.update_session_title("abc", "晴天")
+        return await db.search(user_id, "天气"), await db.search(user_id, "晴天")
+    by_old, by_new = run(db_path, scenario)
+    assert hits(by_old) == [("message", "abc"), ("message", "abc-def"), ("title", "abc-def")]
+    assert hits(by_new) == [("title", "abc")]
@@ -0,0 +1,54 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import transfer
+
+
+class FakeDB:
+    """export_user over three sessions of two messages; fails after fail_after records."""
+    def __init__(self, fail_after: int = None):
+        self.fail_after = fail_after
+        self.resumed_after = "unset"
+
+    async def export_user(self, username, after_session=None):
+        self.resumed_after = after_session
+        records = [{"type": "user", "id": "u", "username": username}] if after_session is None else []
+        for session_id in ("s1", "s2", "s3"):
+            if after_session is not None and session_id <= after_session:
+                continue
+            records.append({"type": "session", "id": session_id})
+            records += [{"type": "message", "id": f"{session_id}-{i}", "session_id": session_id} for i in range(2)]
+            records.append({"type": "checkpoint", "session_id": session_id})
+        for count, record in enumerate(records):
+            if self.fail_after is not None and count == self.fail_after:
+                raise ConnectionError("lost the database")
+            yield record
+
+
+async def all_records(db) -> list:
+    return [record async for record in db.export_user("alice")]
+
+
+def read_records(path: str) -> list:
+    with transfer._open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize("name", ["alice.ndjson", "alice.ndjson.gz"])
+def test_interrupted_export_resumes_from_tmp_file(tmp_path, name):
+    output = str(tmp_path / name)
+    # Interrupted inside session s2, after s1's checkpoint
+    with pytest.raises(ConnectionError):
+        asyncio.run(transfer.export_user(FakeDB(fail_after=7), "alice", output))
+    assert not os.path.exists(output)
+    assert os.path.exists(f"{output}.tmp")
+
+    db = FakeDB()
+    asyncio.run(transfer.export_user(db, "alice", output, resume=True))
+    assert db.resumed_after == "s1"
+    assert read_records(output) == asyncio.run(all_records(FakeDB()))
+    assert not os.path.exists(f"{output}.tmp")
+    assert not os.path.exists(f"{output}.partial")
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+
+
+async def fake_chat_events(request):
+    if request.message == "slow":
+        yield "s:thinking"
+        await asyncio.sleep(30)
+    yield f"c:{request.message}"
+    yield "c:!"
+
+
+@pytest.fixture
+def ws(monkeypatch):
+    monkeypatch.setattr(main, "websocket_config", {"enabled": True, "heartbeat_interval": 60})
+    monkeypatch.setattr(main, "chat_events", fake_chat_events)
+    # Only the endpoint: the real app's lifespan would start every service
+    app = FastAPI()
+    app.add_api_websocket_route("/ws", main.websocket_endpoint)
+    with TestClient(app) as client, client.websocket_connect("/ws?userId=u") as ws:
+        yield ws
+
+
+def chat(ws, stream_id: str, message: str):
+    ws.send_json({"type": "chat", "id": stream_id, "request": {"message": message, "sessionId": "s"}})
+
+
+def test_chat_streams_chunks_then_done(ws):
+    chat(ws, "a", "hi")
+    assert ws.receive_json() == {"type": "chunk", "id": "a", "data": "c:hi"}
+    assert ws.receive_json() == {"type": "chunk", "id": "a", "data": "c:!"}
+    assert ws.receive_json() == {"type": "done", "id": "a", "cancelled": False}
+
+
+def test_cancel_ends_only_that_stream(ws):
+    chat(ws, "slow", "slow")
+    assert ws.receive_json() == {"type": "chunk", "id": "slow", "data": "s:thinking"}
+    ws.send_json({"type": "cancel", "id": "slow"})
+    assert ws.receive_json() == {"type": "done", "id": "slow", "cancelled": True}
+    chat(ws, "b", "again")
+    assert ws.receive_json()["data"] == "c:again"
+
+
+def test_bad_frames_get_an_error_and_the_connection_stays_open(ws):
+    chat(ws, "slow", "slow")
+    assert ws.receive_json()["data"] == "s:thinking"
+    ws.send_bytes(b'{"type": "chat"}')
+    ws.send_text("not json")
+    ws.send_text("[1, 2]")
+    for _ in range(3):
+        assert ws.receive_json() == {"type": "error", "detail": "frames must be JSON objects"}
+    # The stream started before the bad frames is still running
+    ws.send_json({"type": "cancel", "id": "slow"})
+    assert ws.receive_json() == {"type": "done", "id": "slow", "cancelled": True}
+
+
+def test_invalid_chat_request_is_answered_with_its_stream_id(ws):
+    ws.send_json({"type": "chat", "id": "a", "request": {"sessionId": "s"}})
+    error = ws.receive_json()
+    assert (error["type"], error["id"]) == ("error", "a")
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from logger import get_logger
+from circuit_breaker import guarded
+
+logger = get_logger("TitleService")
+
+class TitleService:
+    """
+    Background worker that generates session titles off the /chat stream path.
+    New sessions are queued after their first answer and summarized in batches,
+    so several sessions share a single fast-model round-trip. Calls go through
+    the shared fast-model client from get_client() and its circuit breaker.
+    """
+    def __init__(self, model_name: str, db_service, get_client, batch_size: int = 8,
+                 batch_window: float = 2.0, breaker=None):
+        self.model_name = model_name
+        self.db_service = db_service
+        self.get_client = get_client
+        self.breaker = breaker
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.queue: asyncio.Queue = None
+        self.pending = set()
+        self.listeners = []
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def add_listener(self, callback):
+        """Register a callback(user_id, session_id, title) invoked after a title is stored."""
+        self.listeners.append(callback)
+
+    def enqueue(self, user_id: str, session_id: str, user_msg: str, ai_msg: str):
+        if self.queue is None or session_id in self.pending:
+            return
+        self.pending.add(session_id)
+        self.queue.put_nowait({
+            "user_id": user_id,
+            "session_id": session_id,
+            "user_msg": user_msg,
+            "ai_msg": ai_msg
+        })
+
+    async def _collect_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect_batch()
+            try:
+                titles = await self.summarize_titles(batch)
+                for item, title in zip(batch, titles):
+                    if not title:
+                        continue
+                    await self.db_service.update_session_title(item["session_id"], title)
+                    for callback in self.listeners:
+                        try:
+                            callback(item["user_id"], item["session_id"], title)
+                        except Exception as e:
+                            logger.warning("Title listener failed: %s", e)
+                logger.info("Generated %d session titles in one batch of %d", sum(1 for t in titles if t), len(batch))
+            except Exception as e:
+                logger.warning("Failed to summarize titles: %s", e)
+            finally:
+                for item in batch:
+                    self.pending.discard(item["session_id"])
+
+    async def summarize_titles(self, batch: list) -> list:
+        """Summarize a batch of conversations into titles with one fast-model call."""
+        conversations = "\n\n".join(
+            f"[{i}]\n用户: {item['user_msg'][:500]}\n助手: {(item['ai_msg'] or '')[:500]}"
+            for i, item in enumerate(batch)
+        )
+        prompt = (
+            "请为以下每段对话分别总结一个简短的会话标题（不超过6个字），不要有任何修饰语或标点。\n"
+            "只返回一个 JSON 对象，键为对话编号，值为标题，例如 {\"0\": \"标题\"}。\n\n"
+            f"{conversations}"
+        )
+        async with guarded(self.breaker, "fast model"):
+            response = await self.get_client().chat.completions.create(
+                model=self.model_name,
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=30 * len(batch) + 20
+            )
+        raw = response.choices[0].message.content.strip()
+        start, end = raw.find("{"), raw.rfind("}")
+        parsed = json.loads(raw[start:end + 1]) if start != -1 and end != -1 else {}
+
+        titles = []
+        for i in range(len(batch)):
+            title = str(parsed.get(str(i)) or "").strip()
+            title = title.replace("“", "").replace("”", "").replace("标题：", "")
+            titles.append(title or None)
+        return titles
@@ -0,0 +1,166 @@
+"""
+Bulk export and import of a user's sessions, hard rules and messages as NDJSON,
+gzip-compressed when the file name ends in .gz. Both directions stream, so memory
+stays flat for users of any size, and both can resume after an interruption.
+
+    python transfer.py export alice -o alice.ndjson.gz [--resume]
+    python transfer.py import alice.ndjson.gz [--resume]
+
+The database is the one main.py would use (AIMIN_DB_URL / AIMIN_DB_PATH or
+config.yaml); pass --db-url to point at another one.
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime
+from dotenv import load_dotenv
+
+from config_loader import load_config
+from db import DBService, sqlite_url
+from archive import SessionArchive
+from logger import get_logger
+
+logger = get_logger("Transfer")
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+def _open(path: str, mode: str, compressed: bool = None):
+    if path.endswith(".gz") if compressed is None else compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def _complete_lines(path: str, compressed: bool):
+    """
+    Lines of a possibly truncated export. gzip.open raises on a cut-off stream
+    before handing out the lines it has already decompressed, so decompress by hand.
+    """
+    decompressor = zlib.decompressobj(wbits=31) if compressed else None
+    tail = b""
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 16):
+            if decompressor:
+                try:
+                    chunk = decompressor.decompress(chunk)
+                except zlib.error:
+                    return
+            *lines, tail = (tail + chunk).split(b"\n")
+            for line in lines:
+                yield line.decode("utf-8") + "\n"
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+def storage_url(config: dict) -> str:
+    # Same resolution order as main.get_storage_url
+    storage_config = config.get("storage", {})
+    url = os.getenv("AIMIN_DB_URL") or storage_config.get("url")
+    if url:
+        return url
+    db_path = os.getenv("AIMIN_DB_PATH") or os.path.abspath(os.path.join(base_dir, "..", storage_config["sqlite_path"]))
+    return sqlite_url(db_path)
+
+def _valid_prefix(path: str, compressed: bool):
+    """(lines up to and including the last checkpoint, that checkpoint's session id) of a partial export."""
+    kept, last_session = 0, None
+    for count, line in enumerate(_complete_lines(path, compressed), 1):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break
+        if record.get("type") == "checkpoint":
+            kept, last_session = count, record["session_id"]
+    return kept, last_session
+
+async def export_user(db: DBService, username: str, output: str, resume: bool = False):
+    """
+    Records are written to <output>.tmp, which replaces output once complete. With
+    resume, an interrupted run's .tmp (or else an earlier complete output) is
+    kept up to its last checkpoint and the export continues after that session.
+    """
+    after_session = None
+    compressed = output.endswith(".gz")
+    tmp_path = f"{output}.tmp"
+    partial_path = f"{output}.partial"
+    if resume and os.path.exists(tmp_path):
+        # The new .tmp is written while the interrupted one is read back
+        os.replace(tmp_path, partial_path)
+    source = partial_path if os.path.exists(partial_path) else output
+    with _open(tmp_path, "w", compressed=compressed) as out:
+        if resume and os.path.exists(source):
+            kept, after_session = _valid_prefix(source, compressed)
+            # Copy the complete sessions over; a truncated tail cannot be appended to
+            for _, line in zip(range(kept), _complete_lines(source, compressed)):
+                out.write(line)
+            if after_session:
+                logger.info("Resuming export of %s after session %s", username, after_session)
+        records = 0
+        async for record in db.export_user(username, after_session):
+            out.write(json.dumps(record, ensure_ascii=False, default=_encode) + "\n")
+            records += 1
+    os.replace(tmp_path, output)
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+    logger.info("Exported %d records for %s to %s", records, username, output)
+
+async def _read_records(path: str, skip_until: str = None):
+    skipping = skip_until is not None
+    with _open(path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if skipping and record["type"] not in ("user", "checkpoint"):
+                continue
+            if skipping and record["type"] == "checkpoint":
+                skipping = record["session_id"] != skip_until
+                continue
+            yield record
+
+async def import_file(db: DBService, path: str, resume: bool = False, batch_size: int = 1000):
+    checkpoint_path = f"{path}.checkpoint"
+    skip_until = None
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding="utf-8") as f:
+            skip_until = f.read().strip() or None
+        logger.info("Resuming import of %s after session %s", path, skip_until)
+
+    async def save_checkpoint(session_id: str):
+        with open(checkpoint_path, "w", encoding="utf-8") as f:
+            f.write(session_id)
+
+    counts = await db.import_records(_read_records(path, skip_until), batch_size, save_checkpoint)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    logger.info("Imported %s from %s", counts, path)
+    return counts
+
+async def main(args):
+    load_dotenv(os.path.join(base_dir, "..", ".env.local"))
+    config = load_config()
+    archive_dir = os.path.abspath(os.path.join(base_dir, "..", config.get("archive", {}).get("dir", "./archive")))
+    db = DBService(args.db_url or storage_url(config), archive=SessionArchive(archive_dir))
+    await db.init()
+    try:
+        if args.command == "export":
+            await export_user(db, args.username, args.output or f"{args.username}.ndjson.gz", args.resume)
+        else:
+            await import_file(db, args.input, args.resume, args.batch_size)
+    finally:
+        await db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export or import one user's data as NDJSON")
+    parser.add_argument("--db-url", help="SQLAlchemy URL; defaults to the backend's configured storage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("username")
+    export_parser.add_argument("-o", "--output", help="output file, gzip if it ends in .gz (default <username>.ndjson.gz)")
+    export_parser.add_argument("--resume", action="store_true", help="continue a partial output file")
+    import_parser = commands.add_parser("import")
+    import_parser.add_argument("input")
+    import_parser.add_argument("--resume", action="store_true", help="skip sessions committed by an earlier run")
+    import_parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction")
+    asyncio.run(main(parser.parse_args()))
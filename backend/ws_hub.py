@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+from logger import get_logger
+
+logger = get_logger("WebSocket")
+
+class ClientConnection:
+    """
+    One client WebSocket. Everything sent goes through a bounded outbox drained by
+    a single writer task: chat streams await space in it, so a slow client slows
+    its own model streams down instead of growing server memory.
+    """
+    def __init__(self, websocket, user_id: str, max_queue: int = 256):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.outbox = asyncio.Queue(maxsize=max_queue)
+        self.streams = {}
+        self.last_seen = time.monotonic()
+        self.closed = asyncio.Event()
+
+    async def send(self, message: dict):
+        """Queue a message, waiting while the client is behind."""
+        await self.outbox.put(message)
+
+    def push(self, message: dict) -> bool:
+        """Queue a broadcast event without waiting; False if the client is too far behind."""
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def run_writer(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                await self.websocket.send_text(json.dumps(message, ensure_ascii=False))
+        except Exception:
+            # The socket went away; the receive loop notices and cleans up
+            self.closed.set()
+
+    async def run_heartbeat(self, interval: float, timeout: float):
+        while not self.closed.is_set():
+            await asyncio.sleep(interval)
+            if time.monotonic() - self.last_seen > timeout:
+                logger.info("Closing WebSocket for %s: no heartbeat for %.0f s", self.user_id, timeout)
+                self.closed.set()
+                return
+            self.push({"type": "ping"})
+
+class ConnectionHub:
+    """
+    Connected clients by user, for pushing session events. Connections are per
+    worker process: with several workers, an event reaches the clients connected
+    to the worker that produced it, and other clients fall back to polling.
+    """
+    def __init__(self):
+        self.connections = {}
+
+    def register(self, connection: ClientConnection):
+        self.connections.setdefault(connection.user_id, set()).add(connection)
+
+    def unregister(self, connection: ClientConnection):
+        user_connections = self.connections.get(connection.user_id)
+        if user_connections:
+            user_connections.discard(connection)
+            if not user_connections:
+                del self.connections[connection.user_id]
+
+    def publish(self, user_id: str, message: dict):
+        for connection in list(self.connections.get(user_id, ())):
+            if not connection.push(message):
+                logger.warning("Dropping slow WebSocket client of %s", user_id)
+                connection.closed.set()
+
+    def title_changed(self, user_id: str, session_id: str, title: str):
+        self.publish(user_id, {"type": "u", "sessionId": session_id, "title": title})
+
+    def rules_changed(self, user_id: str, session_id: str):
+        self.publish(user_id, {"type": "rules", "sessionId": session_id})
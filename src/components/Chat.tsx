@@ -4,6 +4,7 @@ import { useState, useRef, useEffect } from 'react';
 import { Send, Settings, Sparkles, User, Bot, ImagePlus, X, Loader2, ChevronDown, ChevronUp, Zap, Command, Plus, Trash2, Menu, PanelLeft, Layers, Search, Brain, Wrench } from 'lucide-react';
 import { Button, Input, cn } from './ui/core';
 import MemoryDrawer from './MemoryDrawer';
+import { ChatSocket } from '../lib/chatSocket';
 import { motion, AnimatePresence } from 'framer-motion';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
@@ -33,6 +34,14 @@ interface Session {
   updatedAt: number;
 }
 
+interface SearchHit {
+  session_id: string;
+  title: string | null;
+  message_id: string | null;
+  kind: 'message' | 'title';
+  snippet: string;
+}
+
 const NeuralPulse = () => (
   <div className="absolute inset-0 overflow-hidden rounded-inherit pointer-events-none">
     <div className="absolute inset-0 bg-gradient-to-r from-blue-500/5 via-transparent to-blue-500/5 animate-[pulse_3s_ease-in-out_infinite]" />
@@ -66,9 +75,12 @@ export default function Chat() {
   const [currentUser, setCurrentUser] = useState<UserProfile | null>(null);
   const [loginUsername, setLoginUsername] = useState('');
   const [isLoginLoading, setIsLoginLoading] = useState(false);
+  const [searchQuery, setSearchQuery] = useState('');
+  const [searchResults, setSearchResults] = useState<SearchHit[]>([]);
 
   const fileInputRef = useRef<HTMLInputElement>(null);
   const scrollRef = useRef<HTMLDivElement>(null);
+  const socketRef = useRef<ChatSocket | null>(null);
 
   // Load user and sessions on mount
   useEffect(() => {
@@ -106,6 +118,45 @@ export default function Chat() {
     }
   };
 
+  // Optional WebSocket transport: chat streams share one connection and titles/rules are pushed
+  useEffect(() => {
+    if (process.env.NEXT_PUBLIC_USE_WEBSOCKET !== '1' || !currentUser) return;
+    const base = process.env.NEXT_PUBLIC_API_URL || window.location.origin;
+    const socket = new ChatSocket(`${base.replace(/^http/, 'ws')}/ws?userId=${currentUser.id}`, (event) => {
+      if (event.type === 'u' && event.sessionId && event.title) {
+        setSessions(prev => prev.map(s => s.id === event.sessionId ? { ...s, title: event.title! } : s));
+      } else if (event.type === 'rules') {
+        window.dispatchEvent(new CustomEvent('aimin:rules-changed', { detail: event.sessionId }));
+      }
+    });
+    socket.connect();
+    socketRef.current = socket;
+    return () => {
+      socket.close();
+      socketRef.current = null;
+    };
+  }, [currentUser]);
+
+  // Titles are generated in the background after the first answer; pick them up from /sessions
+  const refreshSessionTitles = async (userId: string, sessionId: string, attempt = 0) => {
+    try {
+      const apiUrl = process.env.NEXT_PUBLIC_API_URL || '';
+      const response = await fetch(`${apiUrl}/sessions/${userId}`);
+      if (!response.ok) return;
+      const data = await response.json();
+      const titles = new Map<string, string>(data.map((s: any) => [s.id, s.title]));
+      setSessions(prev => prev.map(s => {
+        const title = titles.get(s.id);
+        return title && title !== s.title ? { ...s, title } : s;
+      }));
+      if (titles.get(sessionId) === '新对话' && attempt < 3) {
+        setTimeout(() => refreshSessionTitles(userId, sessionId, attempt + 1), 3000);
+      }
+    } catch (e) {
+      console.error('Failed to refresh session titles', e);
+    }
+  };
+
   const handleLogin = async (e: React.FormEvent) => {
     e.preventDefault();
     if (!loginUsername.trim() || isLoginLoading) return;
@@ -151,20 +202,21 @@ export default function Chat() {
     const uid = userId || currentUser?.id;
     if (!uid) return;
 
-    const newId = Math.random().toString(36).substring(2, 11);
-    const newSession: Session = {
-      id: newId,
-      title: '新对话',
-      updatedAt: Date.now()
-    };
-
     try {
       const apiUrl = process.env.NEXT_PUBLIC_API_URL || '';
-      await fetch(`${apiUrl}/sessions`, {
+      // The server assigns a time-ordered session id
+      const res = await fetch(`${apiUrl}/sessions`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ userId: uid, sessionId: newId, title: '新对话' }),
+        body: JSON.stringify({ userId: uid, title: '新对话' }),
       });
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const { sessionId: newId } = await res.json();
+      const newSession: Session = {
+        id: newId,
+        title: '新对话',
+        updatedAt: Date.now()
+      };
 
       setSessions(prev => [newSession, ...prev]);
       setActiveSessionId(newId);
@@ -242,6 +294,28 @@ export default function Chat() {
     if (activeSessionId) fetchHistory(activeSessionId);
   }, [activeSessionId]);
 
+  // Debounced full-text search across all of the user's sessions
+  useEffect(() => {
+    const q = searchQuery.trim();
+    if (!q || !currentUser) {
+      setSearchResults([]);
+      return;
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const apiUrl = process.env.NEXT_PUBLIC_API_URL || '';
+        const params = new URLSearchParams({ userId: currentUser.id, q, limit: '30' });
+        const response = await fetch(`${apiUrl}/search?${params}`);
+        if (!response.ok) return;
+        const data = await response.json();
+        setSearchResults(data.results);
+      } catch (e) {
+        console.error('Search failed', e);
+      }
+    }, 250);
+    return () => clearTimeout(timer);
+  }, [searchQuery, currentUser]);
+
   const handleResetCurrent = async () => {
     if (!currentUser) return;
     if (!confirm('确定要清空此对话的所有记忆吗？')) return;
@@ -326,26 +400,42 @@ export default function Chat() {
       const recentContextStr = localStorage.getItem('aimin_recent_context');
       const recentContextCount = recentContextStr !== null ? parseInt(recentContextStr, 10) : -1;
 
-      const response = await fetch(`${apiUrl}/chat`, {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          message: userMsg,
-          image: currentImage,
-          sessionId: activeSessionId,
-          userId: currentUser?.id,
-          reasoning: isReasoningEnabled,
-          useMemory: useMemory,
-          recentContextCount: recentContextCount
-        }),
-      });
-
-      if (!response.ok) throw new Error('发送失败');
-
-      const reader = response.body?.getReader();
-      if (!reader) throw new Error('无法读取响应流');
+      const chatRequest = {
+        message: userMsg,
+        image: currentImage,
+        sessionId: activeSessionId,
+        userId: currentUser?.id,
+        reasoning: isReasoningEnabled,
+        useMemory: useMemory,
+        recentContextCount: recentContextCount
+      };
+
+      let chunks: AsyncIterable<string>;
+      const socket = socketRef.current;
+      if (socket?.isOpen) {
+        chunks = socket.chat(chatRequest);
+      } else {
+        const response = await fetch(`${apiUrl}/chat`, {
+          method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(chatRequest),
+        });
+
+        if (!response.ok) throw new Error('发送失败');
+
+        const reader = response.body?.getReader();
+        if (!reader) throw new Error('无法读取响应流');
+
+        const decoder = new TextDecoder();
+        chunks = (async function* () {
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) return;
+            yield decoder.decode(value, { stream: true });
+          }
+        })();
+      }
 
-      const decoder = new TextDecoder();
       let assistantMsg = '';
       let assistantThought = '';
       let assistantStatus = '';
@@ -360,11 +450,8 @@ export default function Chat() {
       let currentMode: 't' | 'c' | 's' | 'u' | null = null;
       let buffer = '';
 
-      while (true) {
-        const { done, value } = await reader.read();
-        if (done) break;
-
-        buffer += decoder.decode(value, { stream: true });
+      for await (const text of chunks) {
+        buffer += text;
 
         // Process the buffer
         // Prefixes are t:, c:, s:, u:
@@ -450,6 +537,13 @@ export default function Chat() {
         return newMsgs;
       });
 
+      // Over the WebSocket the new title is pushed; otherwise poll for it
+      if (currentUser && !socket?.isOpen && sessions.find(s => s.id === activeSessionId)?.title === '新对话') {
+        const userId = currentUser.id;
+        const sessionId = activeSessionId;
+        setTimeout(() => refreshSessionTitles(userId, sessionId), 3000);
+      }
+
     } catch (error) {
       console.error('Chat error:', error);
       setIsLoading(false);
@@ -477,10 +571,33 @@ export default function Chat() {
                 <Plus className="w-4 h-4" />
                 <span>开启新意图</span>
               </button>
+              <div className="mt-4 flex items-center gap-2 px-3 h-10 bg-slate-50 rounded-2xl border border-slate-100">
+                <Search className="w-3.5 h-3.5 text-slate-400 shrink-0" />
+                <input
+                  value={searchQuery}
+                  onChange={(e) => setSearchQuery(e.target.value)}
+                  placeholder="搜索全部对话"
+                  className="flex-1 min-w-0 bg-transparent text-sm outline-none placeholder:text-slate-300"
+                />
+                {searchQuery && (
+                  <button onClick={() => setSearchQuery('')} className="text-slate-300 hover:text-slate-500">
+                    <X className="w-3.5 h-3.5" />
+                  </button>
+                )}
+              </div>
             </div>
 
             <div className="flex-1 overflow-y-auto px-4 space-y-2 custom-scrollbar">
-              {sessions.map(s => (
+              {searchQuery.trim() ? searchResults.map((hit, idx) => (
+                <div
+                  key={`${hit.session_id}-${hit.message_id ?? 'title'}-${idx}`}
+                  onClick={() => { setActiveSessionId(hit.session_id); setSearchQuery(''); setIsSidebarOpen(false); }}
+                  className="w-full p-4 rounded-2xl cursor-pointer transition-all hover:bg-slate-50 text-slate-500"
+                >
+                  <p className="text-sm font-bold truncate">{hit.title || '新对话'}</p>
+                  {hit.kind === 'message' && <p className="text-xs text-slate-400 line-clamp-2 mt-1">{hit.snippet}</p>}
+                </div>
+              )) : sessions.map(s => (
                 <div
                   key={s.id}
                   onClick={() => { setActiveSessionId(s.id); setIsSidebarOpen(false); }}
@@ -63,6 +63,16 @@ export default function MemoryDrawer({ isOpen, onClose, sessionId, userId }: { i
     if (isOpen && userId) fetchRules();
   }, [isOpen, sessionId, userId]);
 
+  // Rules stored by the assistant mid-chat are pushed over the WebSocket, if enabled
+  useEffect(() => {
+    if (!isOpen) return;
+    const onRulesChanged = (e: Event) => {
+      if ((e as CustomEvent).detail === sessionId) fetchRules();
+    };
+    window.addEventListener('aimin:rules-changed', onRulesChanged);
+    return () => window.removeEventListener('aimin:rules-changed', onRulesChanged);
+  }, [isOpen, sessionId, userId]);
+
   const deleteRule = async (id: string) => {
     await fetch(`${apiUrl}/rules`, {
       method: 'DELETE',
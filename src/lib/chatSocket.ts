@@ -0,0 +1,97 @@
+// Client for the backend's multiplexed /ws endpoint: many chat streams plus
+// pushed session events over one WebSocket, reconnecting with backoff.
+
+export interface SocketEvent {
+  type: string;
+  id?: string;
+  data?: string;
+  cancelled?: boolean;
+  sessionId?: string;
+  title?: string;
+  detail?: string;
+}
+
+type StreamHandler = (frame: SocketEvent) => void;
+
+export class ChatSocket {
+  private ws: WebSocket | null = null;
+  private streams = new Map<string, StreamHandler>();
+  private retryDelay = 1000;
+  private stopped = false;
+
+  constructor(private url: string, private onEvent: (event: SocketEvent) => void) {}
+
+  connect() {
+    this.stopped = false;
+    const ws = new WebSocket(this.url);
+    this.ws = ws;
+    ws.onopen = () => { this.retryDelay = 1000; };
+    ws.onmessage = (msg) => {
+      const frame: SocketEvent = JSON.parse(msg.data);
+      if (frame.type === 'ping') {
+        ws.send(JSON.stringify({ type: 'pong' }));
+      } else if (frame.id !== undefined && this.streams.has(frame.id)) {
+        this.streams.get(frame.id)!(frame);
+      } else {
+        this.onEvent(frame);
+      }
+    };
+    ws.onclose = () => {
+      // End streams that were in flight; their turns may have been cut short
+      this.streams.forEach(handler => handler({ type: 'error', detail: 'connection closed' }));
+      this.streams.clear();
+      if (this.ws === ws) this.ws = null;
+      if (!this.stopped) {
+        setTimeout(() => this.connect(), this.retryDelay);
+        this.retryDelay = Math.min(this.retryDelay * 2, 30000);
+      }
+    };
+  }
+
+  get isOpen() {
+    return this.ws?.readyState === WebSocket.OPEN;
+  }
+
+  close() {
+    this.stopped = true;
+    this.ws?.close();
+  }
+
+  cancel(id: string) {
+    this.ws?.send(JSON.stringify({ type: 'cancel', id }));
+  }
+
+  // Yields the same "s:"/"t:"/"c:" chunks as the HTTP /chat stream
+  async *chat(request: Record<string, unknown>): AsyncGenerator<string> {
+    const id = Math.random().toString(36).substring(2, 11);
+    const pending: SocketEvent[] = [];
+    let finished = false;
+    let wake: (() => void) | null = null;
+    this.streams.set(id, (frame) => {
+      pending.push(frame);
+      wake?.();
+    });
+    this.ws!.send(JSON.stringify({ type: 'chat', id, request }));
+    try {
+      while (true) {
+        if (pending.length === 0) {
+          await new Promise<void>(resolve => { wake = resolve; });
+          wake = null;
+          continue;
+        }
+        const frame = pending.shift()!;
+        if (frame.type === 'chunk') {
+          yield frame.data ?? '';
+          continue;
+        }
+        finished = true;
+        if (frame.type === 'done') return;
+        throw new Error(frame.detail || 'stream failed');
+      }
+    } finally {
+      this.streams.delete(id);
+      // The consumer stopped early: stop generating on the server too
+      if (!finished && this.isOpen) this.cancel(id);
+    }
+  }
+}